@@ -3,6 +3,8 @@ import pandas as pd
 from datetime import datetime, timedelta
 import locale
 
+from billing_csv import billing_months, format_month_ranges
+
 # ロケールを日本語に設定
 try:
     locale.setlocale(locale.LC_ALL, 'ja_JP.UTF-8')
@@ -69,7 +71,7 @@ if np_df is not None and '請求金額' in np_df.columns and '請求書発行日
     np_billed_amount = np_df['請求金額'].sum()
     try:
         np_df['請求書発行日_dt'] = pd.to_datetime(np_df['請求書発行日'])
-        np_billing_months = set((d - pd.DateOffset(months=1)).strftime('%Y年%m月') for d in np_df['請求書発行日_dt'])
+        np_billing_months = billing_months(np_df['請求書発行日_dt']) # 発行日の前月（月序数で一括計算）
     except Exception as e:
         st.warning(f"NP CSVの「請求書発行日」の解析中にエラーが発生しました: {e}")
     st.info(f"**NPからの請求金額合計:** {np_billed_amount:,.0f}円")
@@ -83,7 +85,7 @@ if bakuraku_df is not None and '金額' in bakuraku_df.columns and '日付' in b
     bakuraku_billed_amount = bakuraku_df['金額'].sum()
     try:
         bakuraku_df['日付_dt'] = pd.to_datetime(bakuraku_df['日付'])
-        bakuraku_billing_months = set((d - pd.DateOffset(months=1)).strftime('%Y年%m月') for d in bakuraku_df['日付_dt'])
+        bakuraku_billing_months = billing_months(bakuraku_df['日付_dt'])
     except Exception as e:
         st.warning(f"バクラク CSVの「日付」の解析中にエラーが発生しました: {e}")
     st.info(f"**バクラクからの請求金額合計:** {bakuraku_billed_amount:,.0f}円")
@@ -177,9 +179,9 @@ def calculate_holiday_offset_days(start_date: datetime.date, end_date: datetime.
 
 
 # 最短解約日（契約期間）の計算ロジック
-def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_periods: list) -> datetime.date:
+def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_periods: list, today: datetime.date) -> datetime.date:
     contract_start_dt = pd.to_datetime(start_date)
-    today_dt = pd.to_datetime(datetime.today().date())
+    today_dt = pd.to_datetime(today)
 
     current_contract_period_start = contract_start_dt
     
@@ -227,49 +229,14 @@ def calculate_min_cancel_date_declared_logic(cancel_year: int, cancel_month: int
     except ValueError:
         return None
 
-# --- 年月期間を整形するヘルパー関数 ---
-def format_month_ranges(month_strings):
-    if not month_strings:
-        return "N/A"
-
-    # 'YYYY年MM月'形式の文字列をdatetimeオブジェクトに変換しソート
-    months_dt = sorted([datetime.strptime(m, '%Y年%m月') for m in month_strings])
-    
-    if not months_dt:
-        return "N/A"
-
-    ranges = []
-    current_start = months_dt[0]
-    current_end = months_dt[0]
-
-    for i in range(1, len(months_dt)):
-        # 前の月と現在の月が連続しているかチェック
-        # pd.DateOffset(months=1)で1ヶ月進めて、その年と月が現在の月と一致するか
-        next_month_from_current_end = current_end + pd.DateOffset(months=1)
-        if next_month_from_current_end.year == months_dt[i].year and \
-           next_month_from_current_end.month == months_dt[i].month:
-            current_end = months_dt[i]
-        else:
-            # 連続が途切れたので、現在の範囲を追加
-            if current_start == current_end:
-                ranges.append(current_start.strftime('%Y年%m月'))
-            else:
-                ranges.append(f"{current_start.strftime('%Y年%m月')}～{current_end.strftime('%Y年%m月')}")
-            current_start = months_dt[i]
-            current_end = months_dt[i]
-    
-    # 最後の範囲を追加
-    if current_start == current_end:
-        ranges.append(current_start.strftime('%Y年%m月'))
-    else:
-        ranges.append(f"{current_start.strftime('%Y年%m月')}～{current_end.strftime('%Y年%m月')}")
-    
-    return "、".join(ranges)
+# 年月期間の整形は billing_csv.format_month_ranges（月序数で連続区間を求める）を使用
 
 
 # 計算ボタン
 if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
     with st.spinner('計算中...しばらくお待ちください。'):
+        # 計算の基準日（今日）
+        today_date = datetime.today().date()
         # 各計算結果を保持する変数
         formatted_contract_start_date = contract_start_date.strftime('%Y/%m/%d')
         
@@ -277,7 +244,7 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
         
         # 契約残存期間の計算を実行
-        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods)
+        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods, today_date)
         calculated_min_cancel_date_declared = calculate_min_cancel_date_declared_logic(cancel_year, cancel_month, st.session_state.holiday_periods)
         
         # --- 残存期間と請求金額の計算（修正版） ---
@@ -285,7 +252,7 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         payment_plan_amount = 0
         
         if calculated_min_cancel_date_declared:
-            today_date_pd = pd.to_datetime(datetime.today().date())
+            today_date_pd = pd.to_datetime(today_date)
             declared_cancel_date_pd = pd.to_datetime(calculated_min_cancel_date_declared)
             
             # 最短解約日（契約期間）もpd.Timestampに変換
@@ -162,9 +162,9 @@ def get_holiday_days_in_period(start_dt: pd.Timestamp, end_dt: pd.Timestamp, hol
     return total_holiday_days
 
 # 最短解約日（契約期間）の計算ロジック
-def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_periods: list):
+def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_periods: list, today: datetime.date):
     contract_start_dt = pd.to_datetime(start_date)
-    today_dt = pd.to_datetime(datetime.today().date())
+    today_dt = pd.to_datetime(today)
 
     current_cycle_start_dt = contract_start_dt
     
@@ -251,6 +251,8 @@ def calculate_min_cancel_date_declared_logic(contract_start_date: datetime.date,
 # 計算ボタン
 if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
     with st.spinner('計算中...しばらくお待ちください。'):
+        # 計算の基準日（今日）
+        today_date = datetime.today().date()
         # 各計算結果を保持する変数
         formatted_contract_start_date = contract_start_date.strftime('%Y/%m/%d')
         
@@ -258,7 +260,7 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
         
         # 契約残存期間の計算を実行
-        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods)
+        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods, today_date)
         calculated_min_cancel_date_declared = calculate_min_cancel_date_declared_logic(contract_start_date, cancel_year, cancel_month, st.session_state.holiday_periods)
         
         # 残存期間（月）と請求金額の計算
@@ -266,7 +268,6 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         payment_plan_amount = 0
         
         if calculated_min_cancel_date_declared:
-            today_date = datetime.today().date()
             
             # 最短解約日（申告日）が今日よりも未来の場合のみ残存期間を計算
             if calculated_min_cancel_date_declared >= today_date:
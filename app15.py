@@ -186,9 +186,9 @@ def find_next_renewal_date(contract_start_dt: pd.Timestamp, current_date: pd.Tim
         cycle_start_dt = actual_renewal_dt # 次のサイクルへ
 
 # 最短解約日（契約期間）の計算ロジック
-def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_periods: list):
+def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_periods: list, today: datetime.date):
     contract_start_dt = pd.to_datetime(start_date)
-    today_dt = pd.to_datetime(datetime.today().date())
+    today_dt = pd.to_datetime(today)
 
     # 現在の契約サイクルを超えて、次に到来する更新日を探す
     next_renewal_dt = find_next_renewal_date(contract_start_dt, today_dt, holiday_periods)
@@ -200,7 +200,7 @@ def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_
     return min_cancel_dt.date()
 
 # 最短解約日（申告日）の計算ロジック
-def calculate_min_cancel_date_declared_logic(contract_start_date: datetime.date, cancel_year: int, cancel_month: int, holiday_periods: list, apply_cancellation_rule: bool):
+def calculate_min_cancel_date_declared_logic(contract_start_date: datetime.date, cancel_year: int, cancel_month: int, holiday_periods: list, apply_cancellation_rule: bool, today: datetime.date):
     try:
         contract_start_dt = pd.to_datetime(contract_start_date)
         
@@ -208,7 +208,7 @@ def calculate_min_cancel_date_declared_logic(contract_start_date: datetime.date,
         requested_cancel_dt_eom = pd.to_datetime(datetime(cancel_year, cancel_month, 1)).to_period('M').end_time
         
         # 現在の日付 (申告日)
-        today_dt = pd.to_datetime(datetime.today().date())
+        today_dt = pd.to_datetime(today)
 
         if not apply_cancellation_rule:
             # ルールを適用しない場合、ユーザーの希望月をそのまま解約月とする
@@ -242,6 +242,8 @@ def calculate_min_cancel_date_declared_logic(contract_start_date: datetime.date,
 # 計算ボタン
 if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
     with st.spinner('計算中...しばらくお待ちください。'):
+        # 計算の基準日（今日）
+        today_date = datetime.today().date()
         # 各計算結果を保持する変数
         formatted_contract_start_date = contract_start_date.strftime('%Y/%m/%d')
         
@@ -249,16 +251,15 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
         
         # 契約残存期間の計算を実行
-        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods)
+        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods, today_date)
         # apply_cancellation_rule の値を渡す
-        calculated_min_cancel_date_declared = calculate_min_cancel_date_declared_logic(contract_start_date, cancel_year, cancel_month, st.session_state.holiday_periods, apply_cancellation_rule)
+        calculated_min_cancel_date_declared = calculate_min_cancel_date_declared_logic(contract_start_date, cancel_year, cancel_month, st.session_state.holiday_periods, apply_cancellation_rule, today_date)
         
         # 残存期間（月）と請求金額の計算
         remaining_months_rough = 0
         payment_plan_amount = 0
         
         if calculated_min_cancel_date_declared:
-            today_date = datetime.today().date()
             
             # 最短解約日（申告日）が今日よりも未来の場合のみ残存期間を計算
             if calculated_min_cancel_date_declared >= today_date:
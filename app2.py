@@ -150,10 +150,9 @@ def get_holiday_days_in_period(start_period: datetime.date, end_period: datetime
             total_holiday_days += (overlap_end - overlap_start).days + 1
     return total_holiday_days
 
-def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holidays: list):
+def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holidays: list, today: datetime.date):
     """最短解約日（契約期間）を計算する"""
     current_contract_start = start_date
-    today = datetime.today().date()
 
     # 現在の契約サイクルを特定
     # 契約開始から6ヶ月ごとのサイクルで、最も近い未来の契約終了日を見つける
@@ -250,6 +249,8 @@ st.header("計算結果")
 # 計算ボタン
 if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
     with st.spinner('計算中...しばらくお待ちください。'):
+        # 計算の基準日（今日）
+        today_date = datetime.today().date()
         # 各計算結果を保持する変数
         formatted_contract_start_date = contract_start_date.strftime('%Y/%m/%d')
         
@@ -257,11 +258,10 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
         
         # 契約残存期間の計算を実行
-        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods)
+        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods, today_date)
         calculated_min_cancel_date_declared = calculate_min_cancel_date_declared_logic(cancel_year, cancel_month, st.session_state.holiday_periods)
         
         # 残存期間と請求金額の計算
-        today_date = datetime.today().date()
         remaining_months = calculate_remaining_months_logic(today_date, calculated_min_cancel_date_declared, st.session_state.holiday_periods)
         
         payment_plan_amount_for_remaining = billing_unit_price * remaining_months
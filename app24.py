@@ -1,7 +1,28 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import locale
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from billing_csv import BAKURAKU_COLUMNS, NP_COLUMNS, cached_upload_result, read_billing_preview, summarize_billing_csv
+from contract_engine import (
+    HolidayCalendar,
+    calculate_declared_cancel_date,
+    calculate_min_contract_end_date,
+    cancellation_table,
+    ordinals_to_datetime64,
+    remaining_billing_months,
+)
+from contract_roster import (
+    ROSTER_REQUIRED_COLUMNS,
+    SWEEP_HORIZON_MONTHS,
+    compute_roster_parallel,
+    parse_holiday_lines,
+    read_roster_csv,
+    roster_sweep,
+    roster_to_csv_bytes,
+)
 
 # ロケールを日本語に設定
 try:
@@ -17,317 +38,478 @@ st.markdown("---")
 # --- 初期化 ---
 if 'initialized' not in st.session_state:
     st.session_state.holiday_periods = []
-    st.session_state.holiday_input_key = 0 # st.date_inputをリセットするためのキーカウンター
+    st.session_state.holiday_input_key = 0 # 休業期間の編集表をリセットするためのキーカウンター
+    st.session_state.billing_summaries = (None, None) # (NP, バクラク) の集計結果
     st.session_state.initialized = True # 初期化フラグ
 
-# --- 1. ファイルアップロードセクション ---
-st.header("CSVファイルアップロード")
-upload_col1, upload_col2 = st.columns(2)
+# 休業期間の一括編集表のカラム
+HOLIDAY_EDITOR_COLUMNS = ("開始日", "終了日")
 
-np_df = None
-bakuraku_df = None
 
-with upload_col1:
-    st.subheader("NP CSV")
-    np_csv_file = st.file_uploader("NPからの請求CSVをここにドラッグ＆ドロップ、またはファイルを選択", type=["csv"], key="np_csv")
-    if np_csv_file:
-        try:
-            np_df = pd.read_csv(np_csv_file)
+def _to_date(value):
+    """表の編集結果（date・日付文字列・空欄）を datetime.date にする。空欄は None"""
+    if value is None or pd.isna(value) or value == "":
+        return None
+    return pd.to_datetime(value).date()
+
+
+def apply_holiday_edits():
+    """
+    休業期間の編集表とCSV貼り付けの内容をまとめて検証し、重複・連続する期間を結合して登録する（フォーム送信時のコールバック）。
+    不正な行がある場合は何も変更せず、行番号をエラーとして表示する。
+    """
+    editor_state = st.session_state[f"holiday_editor_{st.session_state.holiday_input_key}"]
+    rows = [dict(zip(HOLIDAY_EDITOR_COLUMNS, period)) for period in st.session_state.holiday_periods]
+    for row_index, changes in editor_state["edited_rows"].items():
+        rows[int(row_index)].update(changes)
+    rows += [dict(row) for row in editor_state["added_rows"]]
+    deleted_rows = set(editor_state["deleted_rows"])
+
+    periods = []
+    errors = []
+    for row_number, row in enumerate(rows, start=1):
+        if row_number - 1 in deleted_rows:
+            continue
+        h_start, h_end = (_to_date(row.get(column)) for column in HOLIDAY_EDITOR_COLUMNS)
+        if h_start is None and h_end is None:
+            continue # 空行は無視する
+        if h_start is None or h_end is None or h_start > h_end:
+            errors.append(f"{row_number}行目")
+            continue
+        periods.append((h_start, h_end))
+    try:
+        periods += parse_holiday_lines(st.session_state.holiday_csv_text)
+    except ValueError as e:
+        errors.append(f"貼り付けたCSV（{e}）")
+
+    if errors:
+        st.session_state.holiday_edit_error = f"有効な休業期間を入力してください（開始日≦終了日）: {', '.join(errors)}"
+        return
+    st.session_state.holiday_periods = HolidayCalendar(periods).periods()
+    st.session_state.holiday_input_key += 1 # 編集表を登録後の内容で作り直す
+    st.session_state.holiday_csv_text = ""
+    st.session_state.holiday_edit_error = None
+    st.session_state.holiday_edit_message = f"休業期間を{len(st.session_state.holiday_periods)}件登録しました（重複・連続する期間は結合しています）。"
+    invalidate_calculation()
+
+
+def clear_holiday_periods():
+    st.session_state.holiday_periods = []
+    st.session_state.holiday_input_key += 1 # 編集表をリセット
+    st.session_state.holiday_edit_error = None
+    st.session_state.holiday_edit_message = None
+    invalidate_calculation()
+
+
+def invalidate_calculation():
+    """
+    計算結果に使う入力が変わった時のコールバック。表示中の計算結果を破棄する。
+    計算結果セクションは別のフラグメントなので、rerun_if_calculation_cleared でページ全体を再実行して表示を消す。
+    """
+    if st.session_state.pop("calculation_inputs", None) is not None:
+        st.session_state.calculation_cleared = True
+
+
+def rerun_if_calculation_cleared():
+    """このフラグメントの操作で計算結果を破棄した場合は、ページ全体を再実行する（結果が表示されていない時は再実行しない）"""
+    if st.session_state.pop("calculation_cleared", False):
+        st.rerun(scope="app")
+
+
+# 各セクションは st.fragment で、操作したセクションだけが再実行される。
+# セクション間で使う値（集計結果・入金状況・入力値）は st.session_state を経由して受け渡す。
+
+# --- 1. ファイルアップロードセクション ---
+@st.fragment
+def ingestion_section():
+    st.header("CSVファイルアップロード")
+    upload_col1, upload_col2 = st.columns(2)
+
+    with upload_col1:
+        st.subheader("NP CSV")
+        np_csv_file = st.file_uploader("NPからの請求CSVをここにドラッグ＆ドロップ、またはファイルを選択", type=["csv"], key="np_csv")
+    with upload_col2:
+        st.subheader("バクラク CSV")
+        bakuraku_csv_file = st.file_uploader("バクラクからの請求CSVをここにドラッグ＆ロップ、またはファイルを選択", type=["csv"], key="bakuraku_csv")
+
+    # 2つのファイルは別スレッドで同時に集計する（pandasのCパーサーは解析中にGILを解放するため、待ち時間は遅い方の1ファイル分になる）
+    # 計算に必要なカラムだけを集計する（同じファイルは再実行時に解析し直さない。大きなファイルはチャンク単位で集計）
+    # Streamlitの表示はスレッドから呼べないので、進捗の表示はメインスレッドで集計が終わった順に更新する
+    uploads = {
+        "NP CSV": (upload_col1, np_csv_file, NP_COLUMNS),
+        "バクラク CSV": (upload_col2, bakuraku_csv_file, BAKURAKU_COLUMNS),
+    }
+    summaries = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=len(uploads)) as executor:
+        futures = {}
+        for label, (column, csv_file, columns) in uploads.items():
+            if csv_file:
+                with column:
+                    progress = st.status(f"{label}を読み込み中...", state="running")
+                futures[executor.submit(summarize_billing_csv, csv_file, *columns)] = (label, progress)
+        for future in as_completed(futures):
+            label, progress = futures[future]
+            try:
+                summaries[label] = future.result()
+                progress.update(label=f"{label}の読み込みが完了しました", state="complete")
+            except Exception as e:
+                errors[label] = e
+                progress.update(label=f"{label}の読み込みに失敗しました", state="error")
+
+    np_summary = summaries.get("NP CSV")
+    bakuraku_summary = summaries.get("バクラク CSV")
+
+    with upload_col1:
+        if np_summary is not None:
             st.success("NP CSVを正常に読み込みました。")
-            if '請求金額' not in np_df.columns:
+            if '請求金額' not in np_summary.columns:
                 st.warning("NP CSVに'請求金額'カラムが見つかりません。計算に影響する可能性があります。")
-            st.expander("NP CSVプレビュー").dataframe(np_df.head())
-        except Exception as e:
-            st.error(f"NP CSVの読み込み中にエラーが発生しました: {e}")
-
-with upload_col2:
-    st.subheader("バクラク CSV")
-    bakuraku_csv_file = st.file_uploader("バクラクからの請求CSVをここにドラッグ＆ロップ、またはファイルを選択", type=["csv"], key="bakuraku_csv")
-    if bakuraku_csv_file:
-        try:
-            bakuraku_df = pd.read_csv(bakuraku_csv_file)
+            with st.expander("NP CSVプレビュー"):
+                np_preview_full = st.checkbox("全カラム・全件を読み込んでプレビュー", key="np_preview_full")
+                try:
+                    st.dataframe(read_billing_preview(np_csv_file, full=np_preview_full))
+                except Exception as e:
+                    st.error(f"NP CSVの読み込み中にエラーが発生しました: {e}")
+        elif "NP CSV" in errors:
+            st.error(f"NP CSVの読み込み中にエラーが発生しました: {errors['NP CSV']}")
+
+    with upload_col2:
+        if bakuraku_summary is not None:
             st.success("バクラク CSVを正常に読み込みました。")
-            if '金額' not in bakuraku_df.columns: # ここは必要に応じてカラム名を調整してください
+            if '金額' not in bakuraku_summary.columns: # ここは必要に応じてカラム名を調整してください（BAKURAKU_COLUMNS）
                 st.warning("バクラク CSVに'金額'カラムが見つかりません。計算に影響する可能性があります。")
-            st.expander("バクラク CSVプレビュー").dataframe(bakuraku_df.head())
-        except Exception as e:
-            st.error(f"バクラク CSVの読み込み中にエラーが発生しました: {e}")
+            with st.expander("バクラク CSVプレビュー"):
+                bakuraku_preview_full = st.checkbox("全カラム・全件を読み込んでプレビュー", key="bakuraku_preview_full")
+                try:
+                    st.dataframe(read_billing_preview(bakuraku_csv_file, full=bakuraku_preview_full))
+                except Exception as e:
+                    st.error(f"バクラク CSVの読み込み中にエラーが発生しました: {e}")
+        elif "バクラク CSV" in errors:
+            st.error(f"バクラク CSVの読み込み中にエラーが発生しました: {errors['バクラク CSV']}")
+
+    # アップロードされたファイルが変わった時だけ、集計結果を使う他のセクションも含めてページ全体を再実行する
+    billing_summaries = (np_summary, bakuraku_summary)
+    if st.session_state.billing_summaries != billing_summaries:
+        st.session_state.billing_summaries = billing_summaries
+        st.session_state.pop("calculation_inputs", None) # 表示中の計算結果は古い集計結果を使っているので破棄する
+        st.rerun()
+
+
+ingestion_section()
 st.markdown("---")
 
 
 # --- 2. 未入金金額計算セクション ---
-st.header("未入金金額計算")
-total_billed_amount = 0
-
-np_billed_amount = 0
-if np_df is not None and '請求金額' in np_df.columns:
-    np_billed_amount = np_df['請求金額'].sum()
-    st.info(f"**NPからの請求金額合計:** {np_billed_amount:,.0f}円")
-    total_billed_amount += np_billed_amount
-else:
-    st.info("NP CSVが未アップロード、または請求金額カラムが見つかりません。")
-
-bakuraku_billed_amount = 0
-if bakuraku_df is not None and '金額' in bakuraku_df.columns: # ここは必要に応じてカラム名を調整してください
-    bakuraku_billed_amount = bakuraku_df['金額'].sum()
-    st.info(f"**バクラクからの請求金額合計:** {bakuraku_billed_amount:,.0f}円")
-    total_billed_amount += bakuraku_billed_amount
-else:
-    st.info("バクラク CSVが未アップロード、または金額カラムが見つかりません。")
-
-st.subheader("入金状況入力")
-paid_amount = st.number_input("入金額を入力してください", min_value=0, value=0, step=1000, key="paid_amount", help="手入力で入金された金額を入力します。")
-
-unpaid_amount = total_billed_amount - paid_amount
-payment_status_text = "未入金" if unpaid_amount > 0 else "入金済み" if unpaid_amount == 0 else "過払い"
-
-st.metric(label="現在の未入金金額", value=f"{unpaid_amount:,.0f}円", delta_color="inverse")
-st.markdown(f"**支払い状況:** {payment_status_text}")
+@st.fragment
+def unpaid_amount_section():
+    rerun_if_calculation_cleared()
+    st.header("未入金金額計算")
+    np_summary, bakuraku_summary = st.session_state.billing_summaries
+    total_billed_amount = 0
+
+    np_billed_amount = 0
+    if np_summary is not None and '請求金額' in np_summary.columns:
+        np_billed_amount = np_summary.total_amount
+        st.info(f"**NPからの請求金額合計:** {np_billed_amount:,.0f}円")
+        total_billed_amount += np_billed_amount
+    else:
+        st.info("NP CSVが未アップロード、または請求金額カラムが見つかりません。")
+
+    bakuraku_billed_amount = 0
+    if bakuraku_summary is not None and '金額' in bakuraku_summary.columns: # ここは必要に応じてカラム名を調整してください
+        bakuraku_billed_amount = bakuraku_summary.total_amount
+        st.info(f"**バクラクからの請求金額合計:** {bakuraku_billed_amount:,.0f}円")
+        total_billed_amount += bakuraku_billed_amount
+    else:
+        st.info("バクラク CSVが未アップロード、または金額カラムが見つかりません。")
+
+    st.subheader("入金状況入力")
+    paid_amount = st.number_input("入金額を入力してください", min_value=0, value=0, step=1000, key="paid_amount", help="手入力で入金された金額を入力します。", on_change=invalidate_calculation)
+
+    unpaid_amount = total_billed_amount - paid_amount
+    payment_status_text = "未入金" if unpaid_amount > 0 else "入金済み" if unpaid_amount == 0 else "過払い"
+
+    st.metric(label="現在の未入金金額", value=f"{unpaid_amount:,.0f}円", delta_color="inverse")
+    st.markdown(f"**支払い状況:** {payment_status_text}")
+
+    # 計算結果セクションで使う
+    st.session_state.billing_status = {
+        "np_billed_amount": np_billed_amount,
+        "bakuraku_billed_amount": bakuraku_billed_amount,
+        "total_billed_amount": total_billed_amount,
+        "paid_amount": paid_amount,
+        "unpaid_amount": unpaid_amount,
+        "payment_status_text": payment_status_text,
+    }
+
+
+unpaid_amount_section()
 st.markdown("---")
 
 
 # --- 3. 契約残存期間計算セクション ---
-st.header("契約残存期間計算")
-
-st.subheader("契約情報入力")
-# st.date_input は datetime.date を返す
-contract_start_date_dt = st.date_input("Camel契約開始日を選択してください", value=datetime.today(), key="contract_start_date", format="YYYY/MM/DD")
-# pandas.Timestamp に変換
-contract_start_date_ts = pd.to_datetime(contract_start_date_dt)
-
-
-st.subheader("休業期間設定")
+@st.fragment
+def contract_input_section():
+    rerun_if_calculation_cleared()
+    st.header("契約残存期間計算")
+
+    # 契約・解約情報はフォームにまとめ、「入力内容を反映」を押した時に一度だけ再実行する（入力ごとに再実行しない）
+    with st.form("contract_form"):
+        st.subheader("契約情報入力")
+        # st.date_input は datetime.date を返す
+        contract_start_date_dt = st.date_input("Camel契約開始日を選択してください", value=datetime.today(), key="contract_start_date", format="YYYY/MM/DD")
+
+        st.subheader("解約情報入力")
+        col_cancel_details = st.columns(3)
+        with col_cancel_details[0]:
+            # 新設：解約申告日
+            declared_cancellation_date_dt = st.date_input("解約申告日", value=datetime.today(), key="declared_cancellation_date", format="YYYY/MM/DD", help="ユーザーが解約を申し出た日付です。この月を基準に支払計画を算出します。")
+        with col_cancel_details[1]:
+            cancel_year = st.number_input("解約希望年", min_value=datetime.today().year, value=datetime.today().year, key="cancel_year", help="ユーザーが解約を希望する年です。")
+        with col_cancel_details[2]:
+            cancel_month = st.number_input("解約希望月", min_value=1, max_value=12, value=datetime.today().month, key="cancel_month", help="ユーザーが解約を希望する月です。")
+
+        # チェックボックスを追加 (これは「◆ 最短解約日（契約期間）」の計算には影響せず、ユーザー定義「申告日」の計算にのみ影響)
+        # => 定義変更により、このチェックボックスは「◆ 最短解約日（契約期間）」の計算ロジック内で使われるようになりました。
+        apply_cancellation_rule = st.checkbox(
+            "「更新月の1ヶ月前までの申し出で解約可能」ルールを適用する",
+            value=True, # デフォルトで適用する場合
+            key="apply_cancellation_rule",
+            help="チェックを外すと、解約希望月をそのまま解約月として計算します（ただし、契約開始日より過去の場合は契約開始日）。"
+        )
 
-col_h_start, col_h_end, col_h_add = st.columns([0.4, 0.4, 0.2])
-with col_h_start:
-    new_holiday_start = st.date_input(
-        "新しい休業期間開始日",
-        value=None,
-        key=f"new_holiday_start_{st.session_state.holiday_input_key}",
-        format="YYYY/MM/DD"
-    )
-with col_h_end:
-    new_holiday_end = st.date_input(
-        "新しい休業期間終了日",
-        value=None,
-        key=f"new_holiday_end_{st.session_state.holiday_input_key}",
-        format="YYYY/MM/DD"
-    )
-with col_h_add:
-    st.write("") # スペーサー
-    st.write("") # スペーサー
-    if st.button("入力期間で確定", key="confirm_holiday_btn"):
-        if new_holiday_start and new_holiday_end and new_holiday_start <= new_holiday_end:
-            st.session_state.holiday_periods.append((new_holiday_start, new_holiday_end))
-            st.success(f"休業期間 {new_holiday_start.strftime('%Y/%m/%d')}〜{new_holiday_end.strftime('%Y/%m/%d')} を追加しました。")
-            st.session_state.holiday_input_key += 1 # キーを更新してst.date_inputをリセット
-            st.rerun() # UIを更新するために再実行
-        else:
-            st.error("有効な休業期間を入力してください（開始日≦終了日）。")
-
-
-# 登録済みの休業期間を表示
-if st.session_state.holiday_periods:
-    st.markdown("**現在の登録済み休業期間:**")
-    for i, (h_start, h_end) in enumerate(st.session_state.holiday_periods):
-        st.write(f"- {h_start.strftime('%Y/%m/%d')} 〜 {h_end.strftime('%Y/%m/%d')}")
-    if st.button("全ての休業期間をクリア", key="clear_holidays_btn"):
-        st.session_state.holiday_periods = []
-        st.session_state.holiday_input_key += 1 # キーを更新
-        st.rerun() # UIを更新
-
-st.subheader("解約情報入力")
-col_cancel_details = st.columns(3)
-with col_cancel_details[0]:
-    # 新設：解約申告日
-    declared_cancellation_date_dt = st.date_input("解約申告日", value=datetime.today(), key="declared_cancellation_date", format="YYYY/MM/DD", help="ユーザーが解約を申し出た日付です。この月を基準に支払計画を算出します。")
-with col_cancel_details[1]:
-    cancel_year = st.number_input("解約希望年", min_value=datetime.today().year, value=datetime.today().year, key="cancel_year", help="ユーザーが解約を希望する年です。")
-with col_cancel_details[2]:
-    cancel_month = st.number_input("解約希望月", min_value=1, max_value=12, value=datetime.today().month, key="cancel_month", help="ユーザーが解約を希望する月です。")
-
-# チェックボックスを追加 (これは「◆ 最短解約日（契約期間）」の計算には影響せず、ユーザー定義「申告日」の計算にのみ影響)
-# => 定義変更により、このチェックボックスは「◆ 最短解約日（契約期間）」の計算ロジック内で使われるようになりました。
-apply_cancellation_rule = st.checkbox(
-    "「更新月の1ヶ月前までの申し出で解約可能」ルールを適用する",
-    value=True, # デフォルトで適用する場合
-    help="チェックを外すと、解約希望月をそのまま解約月として計算します（ただし、契約開始日より過去の場合は契約開始日）。"
-)
+        # 請求単価のデフォルト値を11000円に変更
+        billing_unit_price = st.number_input("請求単価", min_value=0, value=11000, step=1000, key="billing_unit_price", help="残存期間分の請求金額計算に使用する単価です。")
+
+        st.form_submit_button("入力内容を反映", type="primary", on_click=invalidate_calculation)
+
+    # 休業期間は表で一括編集する（フォームの送信時にコールバックで検証・結合し、再実行は1回だけ）
+    st.subheader("休業期間設定")
+    with st.form("holiday_form"):
+        st.data_editor(
+            pd.DataFrame(st.session_state.holiday_periods, columns=list(HOLIDAY_EDITOR_COLUMNS)).astype("datetime64[ns]"),
+            num_rows="dynamic",
+            column_config={
+                column: st.column_config.DateColumn(column, format="YYYY/MM/DD") for column in HOLIDAY_EDITOR_COLUMNS
+            },
+            key=f"holiday_editor_{st.session_state.holiday_input_key}",
+            use_container_width=True,
+        )
+        st.text_area(
+            "CSVを貼り付けて追加（1行に「開始日,終了日」）",
+            key="holiday_csv_text",
+            placeholder="2024/01/01,2024/01/31\n2024/05/01,2024/05/10",
+        )
+        st.form_submit_button("休業期間を反映", on_click=apply_holiday_edits)
+    if st.session_state.get("holiday_edit_error"):
+        st.error(st.session_state.holiday_edit_error)
+    elif st.session_state.get("holiday_edit_message"):
+        st.success(st.session_state.holiday_edit_message)
+    if st.session_state.holiday_periods:
+        st.button("全ての休業期間をクリア", key="clear_holidays_btn", on_click=clear_holiday_periods)
+
+    # --- 解約希望月の試算（「全ての計算を実行」を押さなくても、フォームの反映や休業期間の変更で表示を更新する） ---
+    # 契約開始日・休業期間・ルールが同じ間は早見表をキャッシュから使い回し、解約希望年月の変更は表を引くだけで答える
+    cancel_table = cancellation_table(contract_start_date_dt, st.session_state.holiday_periods, apply_cancellation_rule, datetime.today().year)
+    preview = cancel_table.lookup(cancel_year, cancel_month)
+    if preview is None: # 早見表の範囲外の年月は個別に計算する
+        preview = (
+            calculate_min_contract_end_date(contract_start_date_dt, cancel_year, cancel_month, st.session_state.holiday_periods, apply_cancellation_rule),
+            calculate_declared_cancel_date(contract_start_date_dt, cancel_year, cancel_month),
+        )
+    preview_contract_end, preview_declared_cancel = preview
+    preview_remaining_months = remaining_billing_months(declared_cancellation_date_dt, preview_contract_end)
+    preview_cols = st.columns(4)
+    preview_cols[0].metric("最短解約日（契約期間）", preview_contract_end.strftime('%Y/%m/%d') if preview_contract_end else "計算不可")
+    preview_cols[1].metric("最短解約日（申告日）", preview_declared_cancel.strftime('%Y/%m/%d') if preview_declared_cancel else "計算不可")
+    preview_cols[2].metric("残存月数", f"{preview_remaining_months}ヶ月")
+    preview_cols[3].metric("支払計画", f"{billing_unit_price * preview_remaining_months:,.0f}円")
+
+    with st.expander("解約希望月ごとの支払計画（早見表）"):
+        cancel_table_remaining = cancel_table.remaining_months(declared_cancellation_date_dt)
+        cancel_table_df = pd.DataFrame({
+            "解約希望年": cancel_table.months.astype('datetime64[Y]').astype(int) + 1970,
+            "解約希望月": cancel_table.months.astype(int) % 12 + 1,
+            "最短解約日（契約期間）": pd.to_datetime(ordinals_to_datetime64(cancel_table.contract_end)).strftime('%Y/%m/%d'),
+            "残存月数": cancel_table_remaining,
+            "支払計画": cancel_table_remaining * billing_unit_price,
+        })
+        st.vega_lite_chart(cancel_table_df, {
+            "mark": "rect",
+            "encoding": {
+                "x": {"field": "解約希望月", "type": "ordinal"},
+                "y": {"field": "解約希望年", "type": "ordinal"},
+                "color": {"field": "支払計画", "type": "quantitative", "scale": {"scheme": "oranges"}},
+                "tooltip": [
+                    {"field": "解約希望年"}, {"field": "解約希望月"}, {"field": "最短解約日（契約期間）"},
+                    {"field": "残存月数", "type": "quantitative"}, {"field": "支払計画", "type": "quantitative", "format": ","},
+                ],
+            },
+        }, use_container_width=True)
+
+
+contract_input_section()
+st.markdown("---")
 
-# 請求単価のデフォルト値を11000円に変更
-billing_unit_price = st.number_input("請求単価", min_value=0, value=11000, step=1000, key="billing_unit_price", help="残存期間分の請求金額計算に使用する単価です。")
 
+# --- 4. 最終出力フォーマット表示セクション ---
+@st.fragment
+def calculation_result_section():
+    st.header("計算結果")
+
+    # --- 計算ロジック本体 ---
+    # 計算関数は contract_engine にある（休業日数・更新日・最短解約日の計算。再実行ごとに定義し直さない）
+
+    # 計算ボタン
+    # 押した時点の入力値・集計結果を保存し、結果はその値から表示する。入力が変わるとコールバック（invalidate_calculation）で破棄される
+    if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
+        # 他のセクションの入力値・集計結果は st.session_state から読む
+        st.session_state.calculation_inputs = {
+            "contract_start_date": st.session_state.contract_start_date,
+            "declared_cancellation_date": st.session_state.declared_cancellation_date,
+            "cancel_year": st.session_state.cancel_year,
+            "cancel_month": st.session_state.cancel_month,
+            "apply_cancellation_rule": st.session_state.apply_cancellation_rule,
+            "billing_unit_price": st.session_state.billing_unit_price,
+            "holiday_periods": list(st.session_state.holiday_periods),
+            "billing_summaries": st.session_state.billing_summaries,
+            "billing_status": dict(st.session_state.billing_status),
+        }
+
+    calculation_inputs = st.session_state.get("calculation_inputs")
+    if calculation_inputs is not None:
+        with st.spinner('計算中...しばらくお待ちください。'):
+            contract_start_date_dt = calculation_inputs["contract_start_date"]
+            declared_cancellation_date_dt = calculation_inputs["declared_cancellation_date"]
+            cancel_year = calculation_inputs["cancel_year"]
+            cancel_month = calculation_inputs["cancel_month"]
+            apply_cancellation_rule = calculation_inputs["apply_cancellation_rule"]
+            billing_unit_price = calculation_inputs["billing_unit_price"]
+            holiday_periods = calculation_inputs["holiday_periods"]
+            np_summary, bakuraku_summary = calculation_inputs["billing_summaries"]
+            billing_status = calculation_inputs["billing_status"]
+            unpaid_amount = billing_status["unpaid_amount"]
+
+            # 各計算結果を保持する変数
+            formatted_contract_start_date = contract_start_date_dt.strftime('%Y/%m/%d')
+
+            holiday_periods_str_list = [f"{s.strftime('%Y/%m/%d')}〜{e.strftime('%Y/%m/%d')}" for s, e in holiday_periods]
+            formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
+
+            # 休業期間は計算の前に一度だけ正規化する（更新サイクルごとに変換し直さない）
+            holiday_calendar = HolidayCalendar(holiday_periods)
+
+            # 契約残存期間の計算を実行
+            calculated_min_contract_end = calculate_min_contract_end_date(
+                contract_start_date_dt, cancel_year, cancel_month, holiday_calendar, apply_cancellation_rule
+            )
+            # 「◆ 最短解約日（申告日）」はユーザー希望月の月末日
+            calculated_declared_cancel_date = calculate_declared_cancel_date(
+                contract_start_date_dt, cancel_year, cancel_month
+            )
+
+            # 残存期間（月）と請求金額の計算
+            remaining_months_for_billing = 0
+            payment_plan_amount = 0
+
+            if calculated_min_contract_end:
+                # 残存期間: 解約申告日が含まれる月から最短解約日（契約期間）の月まで（両端を含む、パターンA）
+                # 既に解約日を過ぎているか、申告月が最終月より後なら0
+                remaining_months_for_billing = remaining_billing_months(declared_cancellation_date_dt, calculated_min_contract_end)
+                payment_plan_amount = billing_unit_price * remaining_months_for_billing
+
+            st.markdown(f"◆ Camel契約開始日：**{formatted_contract_start_date}**")
+            st.markdown(f"◆ 休業期間：**{formatted_holiday_periods}**")
+            st.markdown(f"◆ 最短解約日（契約期間）：**{calculated_min_contract_end.strftime('%Y/%m/%d') if calculated_min_contract_end else '計算不可'}**")
+            st.markdown(f"◆ 最短解約日（申告日）：**{calculated_declared_cancel_date.strftime('%Y/%m/%d') if calculated_declared_cancel_date else '計算不可'}**")
+
+            # 支払い状況の表示
+            payment_detail = f"総請求額: {billing_status['total_billed_amount']:,.0f}円 "
+            payment_detail += f"(内訳: NP {billing_status['np_billed_amount']:,.0f}円, バクラク {billing_status['bakuraku_billed_amount']:,.0f}円)"
+            payment_detail += f", 入金額: {billing_status['paid_amount']:,.0f}円"
+            payment_detail += f", 未入金: {unpaid_amount:,.0f}円 ({billing_status['payment_status_text']})"
+            st.markdown(f"◆ 支払い状況：**{payment_detail}**")
+
+            # --- 支払計画に発行元を追加するロジック ---
+            payment_plan_label = f"**{payment_plan_amount:,.0f}円** （残存**{remaining_months_for_billing}ヶ月**）"
+            billing_entity_info = ""
+
+            if unpaid_amount == 0:
+                payment_plan_label += "（未入金なし）"
+            else: # 未入金がある場合 (unpaid_amount > 0)
+                if np_summary is not None and bakuraku_summary is not None:
+                    billing_entity_info = "（NP/バクラク）" # 両方ある場合は両方を記載
+                elif np_summary is not None:
+                    billing_entity_info = "（NP）"
+                elif bakuraku_summary is not None:
+                    billing_entity_info = "（バクラク）"
+                else: # CSVファイルがどちらもアップロードされていないが、未入金がある場合
+                    billing_entity_info = "（請求元不明）"
+
+                payment_plan_label += billing_entity_info # 未入金がある場合のみ発行元を付加
+
+            st.markdown(f"◆ 支払計画：{payment_plan_label}")
+    else:
+        st.info("「全ての計算を実行」ボタンを押すと、結果が表示されます。")
+
+
+calculation_result_section()
 st.markdown("---")
 
-# --- 4. 最終出力フォーマット表示セクション ---
-st.header("計算結果")
-
-# --- 計算ロジック本体 ---
-
-# 指定期間内の休業日数を取得するヘルパー関数
-def get_holiday_days_in_period(start_dt: pd.Timestamp, end_dt: pd.Timestamp, holiday_periods: list):
-    total_holiday_days = 0
-    for h_start, h_end in holiday_periods:
-        h_start_dt = pd.to_datetime(h_start)
-        h_end_dt = pd.to_datetime(h_end)
-        
-        overlap_start = max(start_dt, h_start_dt)
-        overlap_end = min(end_dt, h_end_dt)
-        
-        if overlap_start <= overlap_end:
-            total_holiday_days += (overlap_end - overlap_start).days + 1
-    return total_holiday_days
-
-# 次の更新日を計算するヘルパー関数
-# current_reference_dt: 計算の基準となる日付
-# 目的: current_reference_dt (またはそれ以降) を含む最初の更新日を探す
-def find_next_renewal_date(contract_start_dt_ts: pd.Timestamp, current_reference_dt: pd.Timestamp, holiday_periods: list):
-    cycle_start_dt = contract_start_dt_ts
-    
-    # current_reference_dt が契約開始日より前の場合、契約開始日を基準に最初の更新日を探す
-    if current_reference_dt < contract_start_dt_ts:
-        current_reference_dt = contract_start_dt_ts
-        
-    # current_reference_dt を含む最初の更新日を探すループ
-    while True:
-        projected_renewal_dt = cycle_start_dt + pd.DateOffset(months=6)
-        
-        holidays_in_cycle = get_holiday_days_in_period(cycle_start_dt, projected_renewal_dt - pd.Timedelta(days=1), holiday_periods)
-        actual_renewal_dt = projected_renewal_dt + pd.Timedelta(days=holidays_in_cycle)
-        
-        # current_reference_dt を含む更新日を探す
-        if actual_renewal_dt >= current_reference_dt: 
-            return actual_renewal_dt
-        
-        cycle_start_dt = actual_renewal_dt
-
-# 最短解約日（契約期間）の計算ロジック
-# これは「ユーザーが指定した解約希望月と解約ルールを考慮した上での、契約が終了する最終日」
-def calculate_min_contract_end_date(start_date_ts: pd.Timestamp, cancel_year: int, cancel_month: int, holiday_periods: list, apply_cancellation_rule: bool):
-    try:
-        # ユーザーの解約希望月の月末日
-        requested_cancel_dt_eom = pd.to_datetime(datetime(cancel_year, cancel_month, 1)).to_period('M').end_time
-        
-        # 計算の基準日 (契約開始日)
-        current_reference_dt_ts = start_date_ts
-
-        if not apply_cancellation_rule:
-            # ルールを適用しない場合、ユーザーの希望月をそのまま解約月とする
-            # ただし、契約開始日よりも過去の場合は契約開始日とする
-            return max(requested_cancel_dt_eom, current_reference_dt_ts).date()
-
-        # ルールを適用する場合
-        # ユーザーの解約希望が属する更新サイクルを特定するための参照点
-        actual_reference_for_renewal_search = max(current_reference_dt_ts, requested_cancel_dt_eom)
-        
-        # 参照点を含む最初の更新日を探す
-        next_contract_renewal_dt = find_next_renewal_date(start_date_ts, actual_reference_for_renewal_search, holiday_periods)
-
-        # 「更新月の1ヶ月前までの申し出」締め切り日
-        # 例：更新日2025/11/01の場合、1ヶ月前月末は2025/10/31。
-        # ユーザーの10月申告が間に合わないという要件なので、締め切りは2025/10/30となる。
-        deadline_for_current_renewal = (next_contract_renewal_dt - pd.DateOffset(months=1)).to_period('M').end_time - pd.Timedelta(days=1)
-        
-        # ユーザーの希望月が締め切りに間に合うか？
-        # `requested_cancel_dt_eom` が `deadline_for_current_renewal` と同じかそれより前なら間に合う
-        if requested_cancel_dt_eom <= deadline_for_current_renewal:
-            # 希望が間に合う場合、契約はそのサイクルで終了。契約終了日は、
-            # `next_contract_renewal_dt` の前日（または月末）となる。
-            # 例：更新日2025/11/01なら、契約終了日は2025/10/31
-            return (next_contract_renewal_dt - pd.Timedelta(days=1)).date()
-        else:
-            # ユーザーの希望が締め切りに間に合わない場合、次の更新サイクルまで契約が継続される
-            # その次の更新日を探す (基準日は next_contract_renewal_dt + 1日)
-            next_next_renewal_dt = find_next_renewal_date(start_date_ts, next_contract_renewal_dt + pd.Timedelta(days=1), holiday_periods) 
-            
-            # その次の更新サイクルでの契約終了日
-            return (next_next_renewal_dt - pd.Timedelta(days=1)).date()
-
-    except ValueError:
-        return None
 
+# --- 5. 契約リスト一括計算セクション ---
+@st.fragment
+def roster_section():
+    st.header("契約リスト一括計算")
+    st.caption(
+        f"必須カラム: {', '.join(ROSTER_REQUIRED_COLUMNS)}。"
+        "任意カラム: 契約ID, 休業期間（例: 2024/01/01〜2024/01/31, 2024/05/01〜2024/05/10）, "
+        "ルール適用（0/false で「更新月の1ヶ月前までの申し出で解約可能」ルールを適用しない）"
+    )
+    roster_csv_file = st.file_uploader("契約リストCSVをここにドラッグ＆ドロップ、またはファイルを選択", type=["csv"], key="roster_csv")
+    roster_workers = st.number_input(
+        "並列ワーカー数", min_value=1, max_value=os.cpu_count() or 1, value=1, key="roster_workers",
+        help="大量の契約を計算する場合に、複数のプロセスで分担して計算します。件数が少ない場合は並列化されません。"
+    )
+    if roster_csv_file:
+        try:
+            # 同じファイルは再実行時に計算し直さない（ワーカー数は計算結果に影響しない）
+            roster_result = cached_upload_result(
+                roster_csv_file, "roster", lambda data: compute_roster_parallel(read_roster_csv(data), workers=roster_workers)
+            )
+            st.success(f"{len(roster_result):,}件の契約を計算しました。")
+            st.dataframe(roster_result)
+            st.download_button(
+                "計算結果をCSVでダウンロード",
+                data=roster_to_csv_bytes(roster_result),
+                file_name="契約リスト計算結果.csv",
+                mime="text/csv",
+                key="roster_download_btn",
+            )
+
+            with st.expander(f"解約申告月シミュレーション（{SWEEP_HORIZON_MONTHS}ヶ月）"):
+                sweep_first_month = st.date_input(
+                    "シミュレーション開始月", value=date.today().replace(day=1), key="roster_sweep_start", format="YYYY/MM/DD",
+                    help=f"この月から{SWEEP_HORIZON_MONTHS}ヶ月間、各月の1日に解約を申告し、その月末での解約を希望した場合の残存月数・支払計画を計算します。"
+                ).replace(day=1)
+                sweep_view = st.radio("表示する値", ("支払計画", "残存月数"), horizontal=True, key="roster_sweep_view")
+                # 全ての月を一度に計算し、開始月ごとに結果をキャッシュする
+                remaining_table, payment_table = cached_upload_result(
+                    roster_csv_file, f"roster_sweep:{sweep_first_month.isoformat()}",
+                    lambda data: roster_sweep(read_roster_csv(data), sweep_first_month),
+                )
+                sweep_table = payment_table if sweep_view == "支払計画" else remaining_table
+                st.dataframe(sweep_table)
+                st.download_button(
+                    "シミュレーション結果をCSVでダウンロード",
+                    data=sweep_table.to_csv().encode('utf-8-sig'),
+                    file_name=f"解約申告月シミュレーション_{sweep_view}.csv",
+                    mime="text/csv",
+                    key="roster_sweep_download_btn",
+                )
+        except Exception as e:
+            st.error(f"契約リストの計算中にエラーが発生しました: {e}")
 
-# 最短解約日（申告日）の計算ロジック
-# これはシンプルに「ユーザー解約希望月の月末日」
-def calculate_declared_cancel_date(contract_start_date_ts: pd.Timestamp, cancel_year: int, cancel_month: int):
-    try:
-        declared_cancel_dt_eom = pd.to_datetime(datetime(cancel_year, cancel_month, 1)).to_period('M').end_time
-        
-        # 契約開始日よりも過去にはならない
-        return max(declared_cancel_dt_eom, contract_start_date_ts).date()
-    except ValueError:
-        return None
 
-# 計算ボタン
-if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
-    with st.spinner('計算中...しばらくお待ちください。'):
-        # 各計算結果を保持する変数
-        formatted_contract_start_date = contract_start_date_dt.strftime('%Y/%m/%d')
-        
-        holiday_periods_str_list = [f"{s.strftime('%Y/%m/%d')}〜{e.strftime('%Y/%m/%d')}" for s, e in st.session_state.holiday_periods]
-        formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
-        
-        # 契約残存期間の計算を実行
-        calculated_min_contract_end = calculate_min_contract_end_date(
-            contract_start_date_ts, cancel_year, cancel_month, st.session_state.holiday_periods, apply_cancellation_rule
-        )
-        # 「◆ 最短解約日（申告日）」はユーザー希望月の月末日
-        calculated_declared_cancel_date = calculate_declared_cancel_date(
-            contract_start_date_ts, cancel_year, cancel_month
-        )
-        
-        # 残存期間（月）と請求金額の計算
-        remaining_months_for_billing = 0
-        payment_plan_amount = 0
-        
-        if calculated_min_contract_end:
-            # 残存期間の計算ロジックを修正 (パターンA適用)
-            # 基準日: 解約申告日が含まれる月の1日
-            declared_cancel_date_ts = pd.to_datetime(declared_cancellation_date_dt)
-            start_of_billing_period = declared_cancel_date_ts.to_period('M').start_time.date() # パターンAに修正
-            
-            # calculated_min_contract_end の月末
-            end_of_billing_period = calculated_min_contract_end
-            
-            if end_of_billing_period >= start_of_billing_period:
-                start_period = pd.Period(start_of_billing_period, 'M')
-                end_period = pd.Period(end_of_billing_period, 'M')
-                remaining_months_for_billing = (end_period - start_period).n + 1 # 期間の両端を含む
-            else:
-                remaining_months_for_billing = 0 # 既に解約日を過ぎているか、申告月が最終月
-
-            payment_plan_amount = billing_unit_price * remaining_months_for_billing
-            
-        st.markdown(f"◆ Camel契約開始日：**{formatted_contract_start_date}**")
-        st.markdown(f"◆ 休業期間：**{formatted_holiday_periods}**")
-        st.markdown(f"◆ 最短解約日（契約期間）：**{calculated_min_contract_end.strftime('%Y/%m/%d') if calculated_min_contract_end else '計算不可'}**")
-        st.markdown(f"◆ 最短解約日（申告日）：**{calculated_declared_cancel_date.strftime('%Y/%m/%d') if calculated_declared_cancel_date else '計算不可'}**")
-        
-        # 支払い状況の表示
-        payment_detail = f"総請求額: {total_billed_amount:,.0f}円 "
-        payment_detail += f"(内訳: NP {np_billed_amount:,.0f}円, バクラク {bakuraku_billed_amount:,.0f}円)"
-        payment_detail += f", 入金額: {paid_amount:,.0f}円"
-        payment_detail += f", 未入金: {unpaid_amount:,.0f}円 ({payment_status_text})"
-        st.markdown(f"◆ 支払い状況：**{payment_detail}**")
-        
-        # --- 支払計画に発行元を追加するロジック ---
-        payment_plan_label = f"**{payment_plan_amount:,.0f}円** （残存**{remaining_months_for_billing}ヶ月**）"
-        billing_entity_info = ""
-
-        if unpaid_amount == 0:
-            payment_plan_label += "（未入金なし）"
-        else: # 未入金がある場合 (unpaid_amount > 0)
-            if np_df is not None and bakuraku_df is not None:
-                billing_entity_info = "（NP/バクラク）" # 両方ある場合は両方を記載
-            elif np_df is not None:
-                billing_entity_info = "（NP）"
-            elif bakuraku_df is not None:
-                billing_entity_info = "（バクラク）"
-            else: # CSVファイルがどちらもアップロードされていないが、未入金がある場合
-                billing_entity_info = "（請求元不明）"
-
-            payment_plan_label += billing_entity_info # 未入金がある場合のみ発行元を付加
-
-        st.markdown(f"◆ 支払計画：{payment_plan_label}")
-else:
-    st.info("「全ての計算を実行」ボタンを押すと、結果が表示されます。")
\ No newline at end of file
+roster_section()
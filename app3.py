@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 import locale
 from dateutil.relativedelta import relativedelta # 月単位の正確な加算・減算
 
+from contract_engine import HolidayCalendar, add_non_holiday_days, skip_holidays
+
 # ロケールを日本語に設定 (st.date_inputの表示には影響しませんが、日付フォーマット指定で対応)
 try:
     locale.setlocale(locale.LC_ALL, 'ja_JP.UTF-8')
@@ -154,45 +156,25 @@ def get_last_day_of_month(year, month):
         raise ValueError("月は1から12の間で指定してください。")
     return (datetime(year, month, 1) + relativedelta(months=1, days=-1)).date()
 
-def is_holiday(date: datetime.date, holidays: list):
-    """指定された日付が休業期間内にあるかを判定する"""
-    for h_start, h_end in holidays:
-        if h_start <= date <= h_end:
-            return True
-    return False
+def is_holiday(date: datetime.date, holidays):
+    """指定された日付が休業期間内にあるかを判定する（holidays はリストまたは HolidayCalendar）"""
+    return HolidayCalendar.coerce(holidays).is_holiday(date)
 
-def _add_delta_with_holidays(start_date: datetime.date, delta: relativedelta, holidays: list):
+def _add_delta_with_holidays(start_date: datetime.date, delta: relativedelta, holidays):
     """
     指定されたrelativedeltaをstart_dateに加算し、その間に休業日があればその分日付を延伸する。
     月単位の加算はrelativedeltaで行い、日単位の延伸は休業日をスキップする。
+    休業日のスキップは1日ずつ進めず、休業期間の区間演算で求める（contract_engine.add_non_holiday_days）。
     """
     current_date = start_date
-    target_date_raw = start_date + delta # まず休業日を無視した目標日
-
-    # 日付を1日ずつ進めながら休業日をスキップする
-    # deltaが月の加算を含む場合、まず月を加算した目標日を計算し、そこから日単位の調整を行う
-    
-    # ここでは、まず月単位で進め、その後に日単位のオフセットと休業日考慮を行う
     if delta.years or delta.months:
         current_date = start_date + relativedelta(years=delta.years, months=delta.months)
-    
-    days_to_add = delta.days # 日単位のオフセット
-    
-    while days_to_add > 0:
-        current_date += timedelta(days=1)
-        if not is_holiday(current_date, holidays):
-            days_to_add -= 1
-    
-    # 最後に、目標日が休業日であれば、休業日を過ぎるまで進める
-    while is_holiday(current_date, holidays):
-        current_date += timedelta(days=1)
-
-    return current_date
+    return add_non_holiday_days(current_date, delta.days, holidays)
 
 
-def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holidays: list):
+def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holidays: list, today: datetime.date):
     """最短解約日（契約期間）を計算する"""
-    today = datetime.today().date()
+    holidays = HolidayCalendar.coerce(holidays) # 休業期間はサイクルごとではなく一度だけ正規化する
     
     # 現在の契約サイクルを特定
     # 契約開始から6ヶ月ごとのサイクルで、最も近い未来の契約終了日を見つける
@@ -222,9 +204,7 @@ def calculate_min_cancel_date_declared_logic(cancel_year: int, cancel_month: int
 
         # 休業期間を考慮して、解約日を延伸
         # 解約希望日が休業日であれば、休業日を過ぎるまで延伸
-        extended_cancel_date = declared_cancel_date_base
-        while is_holiday(extended_cancel_date, holidays):
-            extended_cancel_date += timedelta(days=1)
+        extended_cancel_date = skip_holidays(declared_cancel_date_base, holidays)
 
         return extended_cancel_date
 
@@ -263,6 +243,8 @@ st.header("計算結果")
 # 計算ボタン
 if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
     with st.spinner('計算中...しばらくお待ちください。'):
+        # 計算の基準日（今日）
+        today_date = datetime.today().date()
         # 各計算結果を保持する変数
         formatted_contract_start_date = contract_start_date.strftime('%Y/%m/%d')
         
@@ -270,11 +252,10 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
         
         # 契約残存期間の計算を実行
-        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods)
+        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods, today_date)
         calculated_min_cancel_date_declared = calculate_min_cancel_date_declared_logic(cancel_year, cancel_month, st.session_state.holiday_periods)
         
         # 残存期間と請求金額の計算
-        today_date = datetime.today().date()
         remaining_months = calculate_remaining_months_logic(today_date, calculated_min_cancel_date_declared, st.session_state.holiday_periods)
         
         payment_plan_amount_for_remaining = billing_unit_price * remaining_months
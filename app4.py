@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 import locale
 from dateutil.relativedelta import relativedelta # 月単位の正確な加算・減算
 
+from contract_engine import HolidayCalendar, add_non_holiday_days, holiday_extended_contract_end, skip_holidays
+
 # ロケールを日本語に設定 (st.date_inputの表示には影響しませんが、日付フォーマット指定で対応)
 try:
     locale.setlocale(locale.LC_ALL, 'ja_JP.UTF-8')
@@ -153,70 +155,25 @@ def get_last_day_of_month(year, month):
         raise ValueError("月は1から12の間で指定してください。")
     return (datetime(year, month, 1) + relativedelta(months=1, days=-1)).date()
 
-def is_holiday(date: datetime.date, holidays: list):
-    """指定された日付が休業期間内にあるかを判定する"""
-    for h_start, h_end in holidays:
-        if h_start <= date <= h_end:
-            return True
-    return False
+def is_holiday(date: datetime.date, holidays):
+    """指定された日付が休業期間内にあるかを判定する（holidays はリストまたは HolidayCalendar）"""
+    return HolidayCalendar.coerce(holidays).is_holiday(date)
 
-def add_business_days_with_holidays(start_date: datetime.date, days_to_add: int, holidays: list):
+def add_business_days_with_holidays(start_date: datetime.date, days_to_add: int, holidays):
     """
     指定された日数（営業日換算）をstart_dateに加算し、休業日をスキップする。
+    休業期間の区間演算で求める（contract_engine.add_non_holiday_days）。
     """
-    current_date = start_date
-    while days_to_add > 0:
-        current_date += timedelta(days=1)
-        if not is_holiday(current_date, holidays):
-            days_to_add -= 1
-    
-    # 最後に、結果の日付が休業日であれば、休業日を過ぎるまで進める
-    while is_holiday(current_date, holidays):
-        current_date += timedelta(days=1)
-    
-    return current_date
+    return add_non_holiday_days(start_date, days_to_add, holidays)
 
 
-def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holidays: list):
+def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holidays, today: datetime.date):
     """
     最短解約日（契約期間）を計算する。
     契約開始から6ヶ月ごとの自動更新で、休業期間を考慮する。
+    各サイクルの休業日数は1日ずつ数えず、休業期間の区間演算で求める（contract_engine.holiday_extended_contract_end）。
     """
-    today = datetime.today().date()
-    
-    # 最初の契約終了日（休業期間なしの場合）
-    first_contract_end_base = start_date + relativedelta(months=6, days=-1) # 6ヶ月後の前日
-    
-    # 現在の契約サイクル終了日を特定
-    current_cycle_end_date = start_date
-    
-    while True:
-        # まずは休業日を考慮しない6ヶ月後の日付を計算
-        next_period_end_base = current_cycle_end_date + relativedelta(months=6, days=-1)
-        
-        # この期間に休業日があるかチェックし、その分日付を延伸
-        # ここが肝心な部分：期間内の休業日数を正確にカウントする
-        
-        actual_days_to_add = 0
-        temp_date = current_cycle_end_date # サイクル開始日
-        
-        # 6ヶ月後の日付に到達するまで、1日ずつ進めながら休業日を数える
-        while temp_date < next_period_end_base:
-             temp_date += timedelta(days=1)
-             if is_holiday(temp_date, holidays):
-                 actual_days_to_add += 1 # 休業日があればその日数分延伸する
-        
-        # 延伸された次の契約終了日
-        next_contract_end = next_period_end_base + timedelta(days=actual_days_to_add)
-
-        # 最終的に次の契約終了日が休業日であれば、さらに休業日を過ぎるまで延伸
-        while is_holiday(next_contract_end, holidays):
-            next_contract_end += timedelta(days=1)
-
-        if next_contract_end >= today:
-            return next_contract_end
-        
-        current_cycle_end_date = next_contract_end + timedelta(days=1) # 次のサイクルの開始日
+    return holiday_extended_contract_end(start_date, today, holidays)
 
 def calculate_min_cancel_date_declared_logic(cancel_year: int, cancel_month: int, holidays: list):
     """
@@ -228,9 +185,7 @@ def calculate_min_cancel_date_declared_logic(cancel_year: int, cancel_month: int
         declared_cancel_date_base = get_last_day_of_month(cancel_year, cancel_month)
 
         # 解約希望日が休業日であれば、休業日を過ぎるまで延伸
-        extended_cancel_date = declared_cancel_date_base
-        while is_holiday(extended_cancel_date, holidays):
-            extended_cancel_date += timedelta(days=1)
+        extended_cancel_date = skip_holidays(declared_cancel_date_base, holidays)
 
         return extended_cancel_date
 
@@ -269,6 +224,8 @@ st.header("計算結果")
 # 計算ボタン
 if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
     with st.spinner('計算中...しばらくお待ちください。'):
+        # 計算の基準日（今日）
+        today_date = datetime.today().date()
         # 各計算結果を保持する変数
         formatted_contract_start_date = contract_start_date.strftime('%Y/%m/%d')
         
@@ -277,11 +234,10 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
         
         # 契約残存期間の計算を実行
-        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods)
+        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods, today_date)
         calculated_min_cancel_date_declared = calculate_min_cancel_date_declared_logic(cancel_year, cancel_month, st.session_state.holiday_periods)
         
         # 残存期間と請求金額の計算
-        today_date = datetime.today().date()
         remaining_months = calculate_remaining_months_logic(today_date, calculated_min_cancel_date_declared, st.session_state.holiday_periods)
         
         payment_plan_amount_for_remaining = billing_unit_price * remaining_months
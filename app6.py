@@ -153,14 +153,14 @@ st.header("計算結果")
 # したがって、日付計算は `datetime` モジュールを使って行います。
 
 # 最短解約日（契約期間）の計算ロジック（仮）
-def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_periods: list):
+def calculate_min_cancel_date_contract_logic(start_date: datetime.date, holiday_periods: list, today: datetime.date):
     # 契約開始日から最初の6ヶ月更新日
     # pd.to_datetimeは、datetime.dateを受け取っても動作します
     first_renewal_date = (pd.to_datetime(start_date) + pd.DateOffset(months=6)).date()
 
     # 現在の契約サイクル終了日を特定
     current_contract_end = start_date
-    while current_contract_end < datetime.today().date():
+    while current_contract_end < today:
         current_contract_end = (pd.to_datetime(current_contract_end) + pd.DateOffset(months=6)).date()
         
     # 休業期間による契約期間の延伸（簡易的な実装）
@@ -205,6 +205,8 @@ def calculate_min_cancel_date_declared_logic(cancel_year: int, cancel_month: int
 # 計算ボタン
 if st.button("全ての計算を実行", key="execute_calculation_btn", type="primary"):
     with st.spinner('計算中...しばらくお待ちください。'):
+        # 計算の基準日（今日）
+        today_date = datetime.today().date()
         # 各計算結果を保持する変数
         formatted_contract_start_date = contract_start_date.strftime('%Y/%m/%d')
         
@@ -212,7 +214,7 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         formatted_holiday_periods = ", ".join(holiday_periods_str_list) if holiday_periods_str_list else "設定なし"
         
         # 契約残存期間の計算を実行
-        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods)
+        calculated_min_cancel_date_contract = calculate_min_cancel_date_contract_logic(contract_start_date, st.session_state.holiday_periods, today_date)
         calculated_min_cancel_date_declared = calculate_min_cancel_date_declared_logic(cancel_year, cancel_month, st.session_state.holiday_periods)
         
         # 残存期間と請求金額の計算
@@ -220,7 +222,6 @@ if st.button("全ての計算を実行", key="execute_calculation_btn", type="pr
         payment_plan_amount = 0
         
         if calculated_min_cancel_date_declared:
-            today_date = datetime.today().date()
             if calculated_min_cancel_date_declared >= today_date:
                 # 月数計算 (pd.to_datetimeを使うとより正確)
                 months_diff = (pd.to_datetime(calculated_min_cancel_date_declared).to_period('M') - pd.to_datetime(today_date).to_period('M')).n
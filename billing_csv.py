@@ -0,0 +1,457 @@
+import csv
+import hashlib
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError: # pyarrowがない環境ではpandasのCパーサーだけで読み込む
+    pa = None
+    pa_csv = None
+
+# 同一プロセス内で保持する解析済みのDataFrame・Arrowテーブルの合計サイズ（全オペレーターで共有）
+PARSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 集計結果（BillingSummary）を保持する件数。1件は数百バイトなので、DataFrameとは別に多めに保持する
+SUMMARY_CACHE_MAX_ENTRIES = 1024
+
+# 計算に使用するカラム（金額, 日付）
+NP_COLUMNS = ('請求金額', '請求書発行日')
+BAKURAKU_COLUMNS = ('金額', '日付')
+
+# プレビューに表示する行数
+PREVIEW_ROWS = 5
+
+# これを超えるサイズのCSVはDataFrameを保持せず、チャンク単位で集計する
+STREAMING_THRESHOLD_BYTES = 64 * 1024 * 1024
+# チャンク集計時に一度に読み込む行数
+STREAM_CHUNK_ROWS = 200_000
+
+# Arrowでプレビューを読み込む際のブロックサイズ（先頭行を読むのに必要な分だけ解析する）
+ARROW_PREVIEW_BLOCK_BYTES = 64 * 1024
+
+
+def _value_nbytes(value) -> int:
+    """キャッシュする値（DataFrame・Arrowテーブル・それらのタプル）のおおよそのメモリ使用量"""
+    if value is None:
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, tuple):
+        return sum(_value_nbytes(v) for v in value)
+    if hasattr(value, "nbytes"): # pyarrow.Table, np.ndarray
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class ParseCache:
+    """
+    アップロードされたCSVの解析結果を、ファイル内容のハッシュをキーに保持するLRUキャッシュ。
+    Streamlitは操作のたびにスクリプト全体を再実行するため、同じファイルを毎回解析し直さないようにする。
+    max_entries（件数）と max_bytes（合計サイズ）のどちらか、または両方で上限を決める。
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _over_limit(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.total_bytes > self.max_bytes
+
+    def get_or_parse(self, key, parse):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        # 解析はロックの外で行う（他ファイルの参照を待たせないため）
+        value = parse()
+        size = _value_nbytes(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self.misses += 1
+            self.total_bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            # 最も古く使われたものから破棄する（上限を超える1件だけの場合は、その呼び出しの間だけ使う）
+            while self._entries and self._over_limit():
+                old_key, _ = self._entries.popitem(last=False)
+                self.total_bytes -= self._sizes.pop(old_key)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 解析済みのDataFrame・Arrowテーブル（合計サイズで上限を決める）と、集計結果（件数で上限を決める）
+_parse_cache = ParseCache(max_bytes=PARSE_CACHE_MAX_BYTES)
+_summary_cache = ParseCache(max_entries=SUMMARY_CACHE_MAX_ENTRIES)
+
+# UploadedFile.file_id -> 内容ハッシュ（再実行のたびにファイル全体をハッシュし直さないため）
+# 複数のアップロードを別スレッドで同時に集計するため、参照・更新はロックで保護する
+_upload_digests = OrderedDict()
+_upload_digests_lock = threading.Lock()
+
+
+def _read_source_bytes(source) -> bytes:
+    """st.file_uploaderのUploadedFile、バイト列、ファイルパスのいずれからも内容を取得する"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def content_digest(data: bytes) -> str:
+    """CSVの内容からキャッシュキー用のハッシュ値を求める"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _source_digest(source, data: bytes) -> str:
+    file_id = getattr(source, "file_id", None)
+    if file_id is None:
+        return content_digest(data)
+    memo_key = (file_id, len(data))
+    with _upload_digests_lock:
+        digest = _upload_digests.get(memo_key)
+    if digest is None:
+        digest = content_digest(data) # ハッシュ計算はロックの外で行う
+        with _upload_digests_lock:
+            _upload_digests[memo_key] = digest
+            while len(_upload_digests) > SUMMARY_CACHE_MAX_ENTRIES:
+                _upload_digests.popitem(last=False)
+    return digest
+
+
+def _coerce_yen(series: pd.Series) -> pd.Series:
+    """金額カラムをint64（円）に揃える。数値に変換できない値と欠損は0円として扱う"""
+    if pd.api.types.is_integer_dtype(series) and not series.hasnans:
+        return series.astype('int64')
+    return pd.to_numeric(series, errors='coerce').fillna(0).round().astype('int64')
+
+
+def _coerce_date(series: pd.Series) -> pd.Series:
+    """日付カラムをdatetime64に揃える。解析できない値はNaTとする"""
+    return pd.to_datetime(series, errors='coerce')
+
+
+def _arrow_header(data: bytes):
+    """
+    pyarrowで読み込めるCSVならヘッダーのカラム名を返す。
+    pyarrowがない場合や、Arrowで扱えない内容（空・UTF-8以外・カラム名の重複）の場合はNoneを返す。
+    """
+    if pa is None or not data:
+        return None
+    first_line = data.split(b'\n', 1)[0].rstrip(b'\r')
+    try:
+        header = next(csv.reader([first_line.decode('utf-8-sig')]), [])
+    except (UnicodeDecodeError, csv.Error):
+        return None
+    if not header or len(set(header)) != len(header):
+        return None # pandasは重複したカラム名を「名前.1」に付け替えるが、Arrowは重複のまま読み込むため
+    return header
+
+
+def _arrow_read(data: bytes, include_columns=(), column_types=None):
+    """
+    pyarrowのマルチスレッドCSVリーダーで読み込み、Arrowのテーブルを返す（文字列もPythonオブジェクトにしない）。
+    include_columnsを指定した場合はそのカラムだけを変換する。読み込めない場合はNoneを返す。
+    """
+    if _arrow_header(data) is None:
+        return None
+    try:
+        return pa_csv.read_csv(
+            pa.BufferReader(data),
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            convert_options=pa_csv.ConvertOptions(include_columns=list(include_columns), column_types=column_types),
+        )
+    except pa.ArrowException: # 行ごとにカラム数が違う・途中にUTF-8以外の文字があるなど
+        return None
+
+
+def _arrow_head(data: bytes, nrows: int):
+    """先頭nrows行だけをArrowのテーブルとして読み込む。読み込めない場合はNoneを返す"""
+    if _arrow_header(data) is None:
+        return None
+    try:
+        reader = pa_csv.open_csv(
+            pa.BufferReader(data),
+            read_options=pa_csv.ReadOptions(block_size=ARROW_PREVIEW_BLOCK_BYTES),
+        )
+        batches = []
+        row_count = 0
+        for batch in reader:
+            batches.append(batch)
+            row_count += batch.num_rows
+            if row_count >= nrows:
+                break
+        return pa.Table.from_batches(batches, schema=reader.schema).slice(0, nrows)
+    except pa.ArrowException:
+        return None
+
+
+def _is_arrow_number(arrow_type) -> bool:
+    return pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_null(arrow_type)
+
+
+def _parse_projected_arrow(data: bytes, amount_column: str, date_column: str):
+    """
+    金額・日付カラムをpyarrowで読み込む。Arrowで扱えない内容の場合はNoneを返す（呼び出し側でpandasで読み直す）。
+    変換規則はpandasで読んだ場合と同じにするため、型の揃え方は _coerce_yen / _coerce_date に任せる。
+    """
+    header = _arrow_header(data)
+    if header is None:
+        return None
+    columns = [c for c in header if c in (amount_column, date_column)] # pandasのusecolsと同じくファイル内の順序
+    if not columns:
+        return None # include_columnsが空だと全カラムを読み込んでしまうため
+    # 日付はpandasと同じ規則（_coerce_date）で解釈するため、Arrowでは文字列のまま読み込む
+    table = _arrow_read(data, columns, column_types={date_column: pa.string()} if date_column in columns else None)
+    if table is None:
+        return None
+    if amount_column in columns and not _is_arrow_number(table.schema.field(amount_column).type):
+        return None # 「"1,000"」のような桁区切りはArrowでは数値にならないため、thousands=','を指定したpandasで読み直す
+    return table.to_pandas()
+
+
+def _parse_projected(data: bytes, amount_column: str, date_column: str) -> pd.DataFrame:
+    df = _parse_projected_arrow(data, amount_column, date_column)
+    if df is None:
+        df = pd.read_csv(
+            io.BytesIO(data),
+            usecols=lambda c: c in (amount_column, date_column), # 存在しないカラムは無視（呼び出し側で警告）
+            thousands=',',
+        )
+    if amount_column in df.columns:
+        df[amount_column] = _coerce_yen(df[amount_column])
+    if date_column in df.columns:
+        df[date_column] = _coerce_date(df[date_column])
+    return df
+
+
+def _read_billing_table(source, data: bytes):
+    """全件をArrowのテーブルとして読み込む（キャッシュ共有）。pyarrowがない・読み込めない場合はNone"""
+    return _parse_cache.get_or_parse(("arrow", _source_digest(source, data)), lambda: _arrow_read(data))
+
+
+def read_billing_csv(source) -> pd.DataFrame:
+    """
+    請求CSVを読み込む。内容が同じファイルはプロセス内で一度だけ解析される。
+    pyarrowがあればキャッシュ済みのArrowのテーブルを元にしたDataFrame（ArrowDtype、データはテーブルと共有）を返す。
+    返されるDataFrameはキャッシュと共有されるため、呼び出し側で変更しないこと。
+    """
+    data = _read_source_bytes(source)
+    table = _read_billing_table(source, data)
+    if table is not None:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return _parse_cache.get_or_parse(("full", _source_digest(source, data)), lambda: pd.read_csv(io.BytesIO(data)))
+
+
+def cached_upload_result(source, kind: str, compute):
+    """
+    アップロードされたファイルの内容ハッシュをキーに compute(bytes) の結果をキャッシュする。
+    請求CSV以外のアップロード（契約リストなど）の計算結果にも使う。
+    """
+    data = _read_source_bytes(source)
+    return _parse_cache.get_or_parse((kind, _source_digest(source, data)), lambda: compute(data))
+
+
+def read_billing_preview(source, full: bool = False, nrows: int = PREVIEW_ROWS):
+    """
+    プレビュー用に先頭行だけを読み込む。full=Trueの場合は全件を読み込んだ上で先頭行を返す。
+    pyarrowで読み込めた場合はArrowのテーブルのまま返す（st.dataframeにそのまま渡せる）。読み込めない場合はDataFrame。
+    """
+    data = _read_source_bytes(source)
+    if full:
+        table = _read_billing_table(source, data)
+        return read_billing_csv(source).head(nrows) if table is None else table.slice(0, nrows)
+
+    def parse():
+        table = _arrow_head(data, nrows)
+        return pd.read_csv(io.BytesIO(data), nrows=nrows) if table is None else table
+
+    return _parse_cache.get_or_parse(("preview", _source_digest(source, data), nrows), parse)
+
+
+@dataclass(frozen=True)
+class BillingSummary:
+    """請求CSVの集計結果（請求金額合計と請求対象年月）"""
+    columns: tuple
+    row_count: int
+    total_amount: int
+    billing_months: frozenset # 'YYYY年MM月' 形式
+
+
+def billing_month_ordinals(dates: pd.Series) -> np.ndarray:
+    """
+    発行日の前月を月序数（year*12+month）で返す（重複なし・昇順）。
+    日付ごとにDateOffsetを作らず、年・月の整数演算だけで求める。
+    """
+    dates = dates.dropna()
+    ordinals = dates.dt.year.to_numpy(dtype='int64') * 12 + dates.dt.month.to_numpy(dtype='int64')
+    return np.unique(ordinals) - 1 # 重複を除いてから前月にずらす
+
+
+def format_month_ordinal(ordinal: int) -> str:
+    """月序数（year*12+month）を 'YYYY年MM月' 形式にする"""
+    year, month_index = divmod(int(ordinal) - 1, 12)
+    return f"{year:04d}年{month_index + 1:02d}月"
+
+
+def billing_months(dates: pd.Series) -> set:
+    """発行日の前月を請求対象年月（'YYYY年MM月'）として集める。app12.py の np_billing_months と同じ規則"""
+    return {format_month_ordinal(o) for o in billing_month_ordinals(dates)}
+
+
+def parse_month_ordinal(month_string: str) -> int:
+    """'YYYY年MM月' 形式の文字列を月序数（year*12+month）にする"""
+    year, month = month_string.rstrip('月').split('年')
+    return int(year) * 12 + int(month)
+
+
+def _month_range_label(first: int, last: int) -> str:
+    if first == last:
+        return format_month_ordinal(first)
+    return f"{format_month_ordinal(first)}～{format_month_ordinal(last)}"
+
+
+def format_month_ranges_grouped(group_ids, month_ordinals) -> dict:
+    """
+    (グループ, 月序数) の組をまとめて受け取り、グループごとに連続する月を範囲表記にした文字列を返す。
+    顧客ごとの請求対象年月を名簿全体で一度に整形するためのもの。ソート後の差分1回で連続区間を求める。
+    """
+    group_ids = np.asarray(group_ids)
+    month_ordinals = np.asarray(month_ordinals, dtype='int64')
+    if len(month_ordinals) == 0:
+        return {}
+    order = np.lexsort((month_ordinals, group_ids))
+    groups = group_ids[order]
+    months = month_ordinals[order]
+
+    # 同じグループ内で前の月と連続していない位置が区間の始まり（重複は同じ区間に含める）
+    same_group = np.empty(len(months), dtype=bool)
+    same_group[0] = False
+    same_group[1:] = groups[1:] == groups[:-1]
+    step = np.empty(len(months), dtype='int64')
+    step[0] = 0
+    step[1:] = months[1:] - months[:-1]
+    run_start = ~same_group | (step > 1)
+    run_end = np.empty(len(months), dtype=bool)
+    run_end[:-1] = run_start[1:]
+    run_end[-1] = True
+
+    result = {}
+    for group, first, last in zip(groups[run_start].tolist(), months[run_start].tolist(), months[run_end].tolist()):
+        label = _month_range_label(first, last)
+        if group in result:
+            result[group] += "、" + label
+        else:
+            result[group] = label
+    return result
+
+
+def format_month_ranges(month_strings) -> str:
+    """
+    'YYYY年MM月' 形式の年月の集合を、連続する月を「～」でまとめて「、」区切りで返す。
+    例: {'2024年01月', '2024年02月', '2024年04月'} -> '2024年01月～2024年02月、2024年04月'
+    """
+    if not month_strings:
+        return "N/A"
+    ordinals = [parse_month_ordinal(m) for m in month_strings]
+    return format_month_ranges_grouped(np.zeros(len(ordinals), dtype='int64'), ordinals)[0]
+
+
+def _summarize_frame(df: pd.DataFrame, amount_column: str, date_column: str) -> BillingSummary:
+    total = int(df[amount_column].sum()) if amount_column in df.columns else 0
+    months = billing_months(df[date_column]) if date_column in df.columns else set()
+    return BillingSummary(tuple(df.columns), len(df), total, frozenset(months))
+
+
+def _open_csv_stream(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+        return source
+    return source # ファイルパスはpandasがそのまま逐次読み込む
+
+
+def _source_size(source) -> int:
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if hasattr(source, "size"):
+        return source.size
+    if hasattr(source, "getbuffer"):
+        return source.getbuffer().nbytes
+    return os.path.getsize(source)
+
+
+def stream_billing_summary(source, amount_column: str, date_column: str,
+                           chunksize: int = STREAM_CHUNK_ROWS) -> BillingSummary:
+    """
+    請求CSVをchunksize行ずつ読み込み、請求金額合計と請求対象年月を逐次集計する。
+    DataFrame全体を保持しないため、ファイルサイズによらずメモリ使用量はチャンク1つ分に収まる。
+    """
+    columns = None
+    row_count = 0
+    total = 0
+    month_ordinals = set()
+    reader = pd.read_csv(
+        _open_csv_stream(source),
+        usecols=lambda c: c in (amount_column, date_column),
+        thousands=',',
+        chunksize=chunksize,
+    )
+    with reader:
+        for chunk in reader:
+            if columns is None:
+                columns = tuple(chunk.columns)
+            row_count += len(chunk)
+            if amount_column in chunk.columns:
+                total += int(_coerce_yen(chunk[amount_column]).sum())
+            if date_column in chunk.columns:
+                month_ordinals.update(billing_month_ordinals(_coerce_date(chunk[date_column])).tolist())
+    months = frozenset(format_month_ordinal(o) for o in month_ordinals) # 文字列化は最後に一度だけ
+    return BillingSummary(columns or (), row_count, total, months)
+
+
+def summarize_billing_csv(source, amount_column: str, date_column: str) -> BillingSummary:
+    """
+    請求CSVを集計する。小さなファイルは金額・日付カラムだけの型付きDataFrameから、
+    STREAMING_THRESHOLD_BYTESを超えるファイルはチャンク単位のストリーミングで集計する。
+    再利用するのは集計結果だけなので、集計に使ったDataFrameはキャッシュに残さない。
+    """
+    streaming = _source_size(source) > STREAMING_THRESHOLD_BYTES
+    if streaming and isinstance(source, (str, os.PathLike)):
+        return stream_billing_summary(source, amount_column, date_column)
+    # メモリ上にあるファイルは内容ハッシュで集計結果をキャッシュする（集計結果は小さい）
+    data = _read_source_bytes(source)
+    if streaming:
+        compute = lambda: stream_billing_summary(data, amount_column, date_column)
+    else:
+        compute = lambda: _summarize_frame(_parse_projected(data, amount_column, date_column), amount_column, date_column)
+    return _summary_cache.get_or_parse(("summary", _source_digest(source, data), amount_column, date_column), compute)
@@ -0,0 +1,160 @@
+"""
+夜間バッチ用のコマンドライン版。Streamlitを使わずに、NP後払い・バクラクの請求CSVの集計と
+契約リストの最短解約日の一括計算を行う。
+
+    python camel_batch.py --np-csv np.csv --bakuraku-csv bakuraku.csv \
+        --roster roster.csv --output result.parquet --workers 4
+
+集計結果は標準出力に、各処理の所要時間は標準エラー出力に表示する。
+計算結果は契約リストを分割して読み込みながら --output に順次書き出す（拡張子 .parquet ならParquet、それ以外はCSV）。
+"""
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+from billing_csv import BAKURAKU_COLUMNS, NP_COLUMNS, format_month_ranges, stream_billing_summary
+from contract_roster import (
+    ROSTER_STREAM_CHUNK_ROWS,
+    compute_roster_parallel,
+    iter_roster_csv,
+    roster_process_pool,
+)
+
+
+@contextmanager
+def stage_timer(label: str):
+    """ブロックの所要時間を標準エラー出力に表示する"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        print(f"[{label}] {time.perf_counter() - started:.2f}秒", file=sys.stderr)
+
+
+class _CsvResultWriter:
+    """計算結果をチャンクごとにCSVへ追記する（UTF-8 BOM付き、ヘッダーは先頭の1回だけ）"""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self._header = True
+
+    def write(self, chunk):
+        chunk.to_csv(self._file, index=False, header=self._header, date_format='%Y/%m/%d')
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetResultWriter:
+    """計算結果をチャンクごとにParquetの行グループとして書き出す（pyarrowが必要）"""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquetで出力するには pyarrow をインストールしてください（.csv を指定するとCSVで出力します）")
+        self._pa = pa
+        self._pq = pq
+        self._path = path
+        self._writer = None
+
+    def write(self, chunk):
+        if self._writer is None:
+            table = self._pa.Table.from_pandas(chunk, preserve_index=False)
+            self._writer = self._pq.ParquetWriter(self._path, table.schema)
+        else:
+            # 休業期間が全て空のチャンクなどで型推論がぶれないよう、先頭チャンクのスキーマに揃える
+            table = self._pa.Table.from_pandas(chunk, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_result_writer(path: str):
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        return _ParquetResultWriter(path)
+    return _CsvResultWriter(path)
+
+
+def summarize_billing(label: str, path: str, columns: tuple) -> None:
+    amount_column, date_column = columns
+    with stage_timer(f"{label}集計"):
+        summary = stream_billing_summary(path, amount_column, date_column)
+    missing = [c for c in columns if c not in summary.columns]
+    if missing:
+        print(f"警告: {label}のCSVに {', '.join(missing)} カラムがありません", file=sys.stderr)
+    print(f"{label}\t件数: {summary.row_count:,}\t請求金額合計: {summary.total_amount:,}円\t"
+          f"請求対象期間: {format_month_ranges(summary.billing_months)}")
+
+
+def run_roster(roster_path: str, output_path: str, workers: int, chunk_rows: int) -> int:
+    """契約リストを chunk_rows 行ずつ計算して書き出し、処理した行数を返す"""
+    row_count = 0
+    elapsed = {"契約リスト読込": 0.0, "契約リスト計算": 0.0, "結果書き出し": 0.0}
+    writer = open_result_writer(output_path)
+    # プロセスの起動は一度だけにして、全チャンクで同じプールを使う
+    pool = roster_process_pool(workers) if workers > 1 else nullcontext()
+    try:
+        with pool as executor:
+            chunks = iter_roster_csv(roster_path, chunk_rows)
+            while True:
+                started = time.perf_counter()
+                roster = next(chunks, None)
+                elapsed["契約リスト読込"] += time.perf_counter() - started
+                if roster is None:
+                    break
+                started = time.perf_counter()
+                result = compute_roster_parallel(roster, workers=workers, executor=executor)
+                elapsed["契約リスト計算"] += time.perf_counter() - started
+                started = time.perf_counter()
+                writer.write(result)
+                elapsed["結果書き出し"] += time.perf_counter() - started
+                row_count += len(roster)
+    finally:
+        writer.close()
+    for label, seconds in elapsed.items():
+        print(f"[{label}] {seconds:.2f}秒", file=sys.stderr)
+    return row_count
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="請求CSVの集計と契約リストの最短解約日の一括計算（Streamlit不要）")
+    parser.add_argument('--np-csv', help="NP後払いの請求CSV")
+    parser.add_argument('--bakuraku-csv', help="バクラクの請求CSV")
+    parser.add_argument('--roster', help="契約リストCSV（契約ID・契約開始日・解約希望年月などを含む）")
+    parser.add_argument('--output', help="契約リストの計算結果の出力先（.parquet ならParquet、それ以外はCSV）")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="契約リスト計算の並列プロセス数（1で並列化しない）")
+    parser.add_argument('--chunk-rows', type=int, default=ROSTER_STREAM_CHUNK_ROWS, help="契約リストを一度に読み込む行数")
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not (args.np_csv or args.bakuraku_csv or args.roster):
+        parser.error("--np-csv / --bakuraku-csv / --roster のいずれかを指定してください")
+    if args.roster and not args.output:
+        parser.error("--roster を指定する場合は --output も指定してください")
+
+    try:
+        if args.np_csv:
+            summarize_billing("NP後払い", args.np_csv, NP_COLUMNS)
+        if args.bakuraku_csv:
+            summarize_billing("バクラク", args.bakuraku_csv, BAKURAKU_COLUMNS)
+        if args.roster:
+            row_count = run_roster(args.roster, args.output, max(1, args.workers), args.chunk_rows)
+            print(f"契約リスト\t件数: {row_count:,}\t出力先: {args.output}")
+    except (OSError, ValueError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
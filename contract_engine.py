@@ -0,0 +1,787 @@
+import calendar
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+# 契約の更新サイクル（月数）
+RENEWAL_CYCLE_MONTHS = 6
+
+# 最短解約日の計算結果をキャッシュする件数（プロセス全体で共有し、セッションをまたいで再利用する）
+CONTRACT_RESULT_CACHE_SIZE = 4096
+# 解約希望月の早見表（CancellationTable）の年数と、キャッシュする表の数
+CANCEL_LOOKUP_YEARS = 5
+CANCELLATION_TABLE_CACHE_SIZE = 256
+# 更新日の並び（RenewalSchedule）をキャッシュする契約数
+RENEWAL_SCHEDULE_CACHE_SIZE = 1024
+
+
+def to_ordinal(d) -> int:
+    """datetime.date / datetime / pd.Timestamp / 日序数(int) を日序数に揃える"""
+    if hasattr(d, "toordinal"):
+        return d.toordinal()
+    return int(d)
+
+
+def add_months(d: date, months: int) -> date:
+    """months ヶ月後の日付。存在しない日は月末に丸める（pd.DateOffset(months=n) と同じ）"""
+    month_index = d.year * 12 + d.month - 1 + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return date(year, month, min(d.day, calendar.monthrange(year, month)[1]))
+
+
+def month_end(year: int, month: int) -> date:
+    """指定された年月の最終日"""
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def month_ordinal(d) -> int:
+    """年月を月序数（year*12+month）にする"""
+    return d.year * 12 + d.month
+
+
+def merge_holiday_intervals(holiday_periods) -> list:
+    """
+    休業期間 [(開始日, 終了日), ...] を日序数の区間に変換し、ソートした上で重複・連続する期間を結合する。
+    例: [(2023/1/1, 2023/1/5), (2023/1/4, 2023/1/8)] -> [(2023/1/1, 2023/1/8)]（app3.py の結合ロジックと同じ）
+    開始日 > 終了日 の不正な期間は無視する。
+    """
+    intervals = sorted(
+        (to_ordinal(h_start), to_ordinal(h_end))
+        for h_start, h_end in holiday_periods
+        if to_ordinal(h_start) <= to_ordinal(h_end)
+    )
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1] + 1: # 期間が連続または重複
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class HolidayCalendar:
+    """
+    休業期間を一度だけ正規化して保持する。
+    期間は結合済みの日序数区間として昇順に並び、累積日数（prefix sum）で任意期間の休業日数をO(log H)で求める。
+    """
+
+    def __init__(self, holiday_periods=()):
+        intervals = merge_holiday_intervals(holiday_periods)
+        self.starts = [start for start, _ in intervals]
+        self.ends = [end for _, end in intervals]
+        # _cumulative[i] = 先頭からi個の区間の休業日数の合計
+        self._cumulative = [0]
+        for start, end in intervals:
+            self._cumulative.append(self._cumulative[-1] + end - start + 1)
+
+    @classmethod
+    def coerce(cls, holidays):
+        """HolidayCalendarはそのまま、休業期間のリストはHolidayCalendarに変換して返す"""
+        if isinstance(holidays, cls):
+            return holidays
+        return cls(holidays or ())
+
+    @property
+    def key(self) -> tuple:
+        """結合済み区間のタプル（同じ休業日の集合なら同じ値になる）"""
+        return tuple(zip(self.starts, self.ends))
+
+    def periods(self) -> list:
+        """結合済みの休業期間を [(開始日, 終了日), ...]（datetime.date）で返す"""
+        return [(date.fromordinal(start), date.fromordinal(end)) for start, end in zip(self.starts, self.ends)]
+
+    def days_through(self, ordinal: int) -> int:
+        """日序数 ordinal 以前（当日を含む）の休業日数"""
+        i = bisect_right(self.starts, ordinal)
+        days = self._cumulative[i]
+        if i and self.ends[i - 1] > ordinal:
+            days -= self.ends[i - 1] - ordinal # 途中までしか経過していない区間
+        return days
+
+    def overlap_days(self, start, end) -> int:
+        """start〜end（両端を含む）に含まれる休業日数"""
+        start_ord = to_ordinal(start)
+        end_ord = to_ordinal(end)
+        if start_ord > end_ord:
+            return 0
+        return self.days_through(end_ord) - self.days_through(start_ord - 1)
+
+    def first_difference(self, other: "HolidayCalendar"):
+        """休業日の集合が self と other で最初に食い違う日の日序数（同じ集合なら None）"""
+        for (a_start, a_end), (b_start, b_end) in zip(self.key, other.key):
+            if a_start != b_start:
+                return min(a_start, b_start)
+            if a_end != b_end:
+                return min(a_end, b_end) + 1
+        if len(self) != len(other):
+            longer = self if len(self) > len(other) else other
+            return longer.starts[min(len(self), len(other))]
+        return None
+
+    def is_holiday(self, d) -> bool:
+        ordinal = to_ordinal(d)
+        i = bisect_right(self.starts, ordinal)
+        return bool(i) and ordinal <= self.ends[i - 1]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def _cycle_day_is_stable(d: date) -> bool:
+    """
+    6ヶ月ずつ進めても日が月末に丸められない日付か。
+    この場合、k サイクル先の開始日は add_months(d, 6k) で直接求められる。
+    """
+    if d.day <= 28:
+        return True
+    other_month = (d.month + RENEWAL_CYCLE_MONTHS - 1) % 12 + 1
+    if d.month == 2 or other_month == 2:
+        return False
+    return d.day <= calendar.monthrange(2001, other_month)[1]
+
+
+def _holiday_free_cycles(cycle_start: date, bound_ordinal: int) -> int:
+    """cycle_start から数えて、更新日が bound_ordinal より前に収まるサイクル数（日が丸められない前提）"""
+    bound = date.fromordinal(bound_ordinal)
+    months_between = (bound.year * 12 + bound.month) - (cycle_start.year * 12 + cycle_start.month)
+    if cycle_start.day >= bound.day:
+        months_between -= 1
+    return max(0, months_between // RENEWAL_CYCLE_MONTHS)
+
+
+def next_renewal_ordinal(contract_start, reference, holidays) -> int:
+    """
+    reference 以降（当日を含む）で最初に到来する更新日を日序数で返す。
+    各サイクルは「開始日 + 6ヶ月」にそのサイクル内の休業日数を加えた日に更新される。
+    休業期間に掛からないサイクルは月単位の計算でまとめて読み飛ばし、休業期間と重なるサイクルだけを1つずつ計算する。
+    """
+    holiday_calendar = HolidayCalendar.coerce(holidays)
+    cycle_start_ord = to_ordinal(contract_start)
+    threshold = max(to_ordinal(reference), cycle_start_ord) # 契約開始日より前の基準日は契約開始日とする
+
+    while True:
+        cycle_start = date.fromordinal(cycle_start_ord)
+        if _cycle_day_is_stable(cycle_start):
+            # 次に掛かる休業期間の開始日、または基準日の手前までは休業日なしで更新が続く
+            i = bisect_left(holiday_calendar.ends, cycle_start_ord)
+            bound = threshold
+            if i < len(holiday_calendar):
+                bound = min(bound, holiday_calendar.starts[i] + 1)
+            skipped = _holiday_free_cycles(cycle_start, bound)
+            if skipped:
+                cycle_start = add_months(cycle_start, RENEWAL_CYCLE_MONTHS * skipped)
+                cycle_start_ord = cycle_start.toordinal()
+
+        projected_renewal_ord = add_months(cycle_start, RENEWAL_CYCLE_MONTHS).toordinal()
+        holidays_in_cycle = holiday_calendar.overlap_days(cycle_start_ord, projected_renewal_ord - 1)
+        actual_renewal_ord = projected_renewal_ord + holidays_in_cycle
+
+        if actual_renewal_ord >= threshold:
+            return actual_renewal_ord
+
+        cycle_start_ord = actual_renewal_ord
+
+
+class RenewalSchedule:
+    """
+    契約1件の更新日の並び（昇順の日序数）。必要になった日付まで遅延して伸ばし、検索は bisect で行う。
+    更新日 r の次の更新日は r を開始日とする1サイクル分の計算で求まるので、並びは契約開始日から一度だけ作ればよい。
+    複数のセッション（スレッド）から共有されるため、並びの伸長はロックで保護する。
+    """
+
+    def __init__(self, contract_start, holidays):
+        self.contract_start = to_ordinal(contract_start)
+        self.holidays = HolidayCalendar.coerce(holidays)
+        self.boundaries = []
+        self._lock = threading.Lock()
+
+    def _extend_through(self, ordinal: int) -> None:
+        """ordinal 以降の更新日が少なくとも1つ含まれるまで並びを伸ばす"""
+        if self.boundaries and self.boundaries[-1] >= ordinal:
+            return
+        with self._lock:
+            while not self.boundaries or self.boundaries[-1] < ordinal:
+                cycle_start = self.boundaries[-1] if self.boundaries else self.contract_start
+                self.boundaries.append(next_renewal_ordinal(cycle_start, cycle_start + 1, self.holidays))
+
+    def with_calendar(self, holidays) -> "RenewalSchedule":
+        """
+        休業期間を変更した場合の並びを返す。最初に変わった休業日より前に完結するサイクルの更新日
+        （更新日 <= 変更日）はそのまま引き継ぎ、それ以降のサイクルだけを必要になった時に計算し直す。
+        """
+        holiday_calendar = HolidayCalendar.coerce(holidays)
+        schedule = RenewalSchedule(self.contract_start, holiday_calendar)
+        with self._lock:
+            boundaries = list(self.boundaries)
+        changed = self.holidays.first_difference(holiday_calendar)
+        schedule.boundaries = boundaries if changed is None else boundaries[:bisect_right(boundaries, changed)]
+        return schedule
+
+    def cycle_index(self, ordinal: int) -> int:
+        """ordinal を含むサイクルの番号（契約開始日〜最初の更新日の前日が0）"""
+        self._extend_through(ordinal + 1)
+        return bisect_right(self.boundaries, ordinal)
+
+    def next_renewal(self, reference) -> int:
+        """reference 以降（当日を含む）で最初に到来する更新日（next_renewal_ordinal と同じ結果）"""
+        return self.boundaries[self.cycle_index(max(to_ordinal(reference), self.contract_start) - 1)]
+
+    def __len__(self):
+        return len(self.boundaries)
+
+
+def renewal_schedule(contract_start, holidays) -> RenewalSchedule:
+    """契約開始日と休業期間（結合済み区間）ごとに RenewalSchedule を一度だけ作り、プロセス全体でキャッシュする"""
+    return _cached_renewal_schedule(to_ordinal(contract_start), HolidayCalendar.coerce(holidays).key)
+
+
+# 契約開始日ごとに直近に作った RenewalSchedule（休業期間が変わった時に変更前の並びを引き継ぐため）
+_latest_schedules = OrderedDict()
+_latest_schedules_lock = threading.Lock()
+
+
+@lru_cache(maxsize=RENEWAL_SCHEDULE_CACHE_SIZE)
+def _cached_renewal_schedule(start_ord: int, holiday_key: tuple) -> RenewalSchedule:
+    holiday_calendar = HolidayCalendar(holiday_key)
+    with _latest_schedules_lock:
+        previous = _latest_schedules.get(start_ord)
+    if previous is None:
+        schedule = RenewalSchedule(start_ord, holiday_calendar)
+    else:
+        # 同じ契約で休業期間を追加・削除した場合は、変更日より前の更新日を計算し直さない
+        schedule = previous.with_calendar(holiday_calendar)
+    with _latest_schedules_lock:
+        _latest_schedules[start_ord] = schedule
+        _latest_schedules.move_to_end(start_ord)
+        while len(_latest_schedules) > RENEWAL_SCHEDULE_CACHE_SIZE:
+            _latest_schedules.popitem(last=False)
+    return schedule
+
+
+def skip_holidays(d, holidays) -> date:
+    """d が休業日であれば、休業期間を過ぎた最初の日を返す（休業日でなければ d のまま）"""
+    holiday_calendar = HolidayCalendar.coerce(holidays)
+    ordinal = to_ordinal(d)
+    i = bisect_right(holiday_calendar.starts, ordinal)
+    if i and ordinal <= holiday_calendar.ends[i - 1]:
+        ordinal = holiday_calendar.ends[i - 1] + 1 # 結合済みなので翌日は休業日ではない
+    return date.fromordinal(ordinal)
+
+
+def add_non_holiday_days(start_date, days_to_add: int, holidays) -> date:
+    """
+    start_date の翌日から休業日を除いて days_to_add 日進めた日付を返す（app3.py / app4.py の休業日スキップと同じ規則）。
+    days_to_add が0以下の場合は進めず、start_date が休業日であれば休業期間を過ぎるまで延伸する。
+    1日ずつ進めずに、休業期間の累積日数を二分探索してO(log H)で求める。
+    """
+    holiday_calendar = HolidayCalendar.coerce(holidays)
+    if days_to_add <= 0:
+        return skip_holidays(start_date, holiday_calendar)
+
+    base = to_ordinal(start_date)
+    holidays_through_base = holiday_calendar.days_through(base)
+
+    def working_days_before(interval_index):
+        # base の翌日から区間の開始日の前日までにある休業日以外の日数
+        last_day = max(holiday_calendar.starts[interval_index], base + 1) - 1
+        return (last_day - base) - (holiday_calendar.days_through(last_day) - holidays_through_base)
+
+    # 目標日より前に収まる休業期間のうち最後のものを二分探索する
+    lo = bisect_right(holiday_calendar.ends, base) # base 以前に終わる区間は対象外
+    hi = len(holiday_calendar)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if working_days_before(mid) < days_to_add:
+            lo = mid + 1
+        else:
+            hi = mid
+    skipped_holidays = 0
+    if lo > bisect_right(holiday_calendar.ends, base):
+        skipped_holidays = holiday_calendar.days_through(holiday_calendar.ends[lo - 1]) - holidays_through_base
+    return date.fromordinal(base + days_to_add + skipped_holidays)
+
+
+def holiday_extended_contract_end(start_date, today, holidays) -> date:
+    """
+    app4.py の最短解約日（契約期間）の規則で、today 以降に到来する最初のサイクル終了日を返す。
+    各サイクルは「開始日 + 6ヶ月 - 1日」を、開始日の翌日からその日までの休業日数だけ延伸し、
+    延伸後の日が休業日であれば休業期間を過ぎるまで延伸する。次のサイクルはその翌日から始まる。
+    """
+    holiday_calendar = HolidayCalendar.coerce(holidays)
+    today_ord = to_ordinal(today)
+    cycle_start = date.fromordinal(to_ordinal(start_date))
+    while True:
+        base_end_ord = add_months(cycle_start, RENEWAL_CYCLE_MONTHS).toordinal() - 1
+        extension_days = holiday_calendar.overlap_days(cycle_start.toordinal() + 1, base_end_ord)
+        cycle_end = skip_holidays(base_end_ord + extension_days, holiday_calendar)
+        if cycle_end.toordinal() >= today_ord:
+            return cycle_end
+        cycle_start = date.fromordinal(cycle_end.toordinal() + 1)
+
+
+# --- app24.py の計算ロジック（Streamlitに依存しない純粋関数。同じ入力には常に同じ結果を返す） ---
+
+def get_holiday_days_in_period(start: date, end: date, holidays) -> int:
+    """start〜end（両端を含む）に含まれる休業日数。holidays は休業期間のリストまたは HolidayCalendar"""
+    return HolidayCalendar.coerce(holidays).overlap_days(start, end)
+
+
+def find_next_renewal_date(contract_start: date, reference: date, holidays) -> date:
+    """reference 以降（当日を含む）で最初に到来する更新日（契約ごとの RenewalSchedule を使い回す）"""
+    return date.fromordinal(renewal_schedule(contract_start, holidays).next_renewal(reference))
+
+
+def calculate_min_contract_end_date(contract_start: date, cancel_year: int, cancel_month: int, holidays,
+                                    apply_cancellation_rule: bool):
+    """
+    最短解約日（契約期間）: 解約希望月と「更新月の1ヶ月前までの申し出」ルールを考慮した契約の最終日。
+    pandasを使わず日序数の演算で求める。解約希望年月が不正な場合は None を返す。
+    同じ入力（休業期間は結合済み区間で比較）の結果はプロセス全体でキャッシュする（contract_cache_info）。
+    """
+    # ルールを適用しない場合、休業期間は結果に影響しないのでキーに含めない
+    holiday_key = HolidayCalendar.coerce(holidays).key if apply_cancellation_rule else ()
+    return _cached_min_contract_end_date(
+        to_ordinal(contract_start), int(cancel_year), int(cancel_month), holiday_key, bool(apply_cancellation_rule)
+    )
+
+
+@lru_cache(maxsize=CONTRACT_RESULT_CACHE_SIZE)
+def _cached_min_contract_end_date(start_ord: int, cancel_year: int, cancel_month: int, holiday_key: tuple,
+                                  apply_cancellation_rule: bool):
+    try:
+        requested_cancel_eom_ord = month_end(cancel_year, cancel_month).toordinal()
+    except ValueError:
+        return None
+
+    if not apply_cancellation_rule:
+        # 希望月の月末をそのまま解約日とする（契約開始日より前にはしない）
+        return date.fromordinal(max(requested_cancel_eom_ord, start_ord))
+
+    try:
+        # 希望月の月末を過ぎてから（契約開始日以降で）最初に到来する更新日
+        schedule = _cached_renewal_schedule(start_ord, holiday_key)
+        renewal_ord = schedule.next_renewal(requested_cancel_eom_ord + 1)
+
+        # 締め切りは更新月の前月末の前日（例：更新日2025/11/01 -> 2025/10/30）
+        renewal = date.fromordinal(renewal_ord)
+        deadline_ord = date(renewal.year, renewal.month, 1).toordinal() - 2
+        if requested_cancel_eom_ord <= deadline_ord:
+            return date.fromordinal(renewal_ord - 1)
+
+        # 間に合わない場合は次の更新サイクルの最終日まで継続
+        next_renewal_ord = schedule.next_renewal(renewal_ord + 1)
+        return date.fromordinal(next_renewal_ord - 1)
+    except (ValueError, OverflowError):
+        return None # 更新日が9999年12月31日より後になる場合は計算できない
+
+
+def calculate_declared_cancel_date(contract_start: date, cancel_year: int, cancel_month: int):
+    """最短解約日（申告日）: 解約希望月の月末日（契約開始日より前にはしない）。不正な年月は None（結果はキャッシュする）"""
+    return _cached_declared_cancel_date(to_ordinal(contract_start), int(cancel_year), int(cancel_month))
+
+
+@lru_cache(maxsize=CONTRACT_RESULT_CACHE_SIZE)
+def _cached_declared_cancel_date(start_ord: int, cancel_year: int, cancel_month: int):
+    try:
+        requested_cancel_eom_ord = month_end(cancel_year, cancel_month).toordinal()
+    except ValueError:
+        return None
+    return date.fromordinal(max(requested_cancel_eom_ord, start_ord))
+
+
+def contract_cache_info() -> dict:
+    """最短解約日の計算結果・早見表・更新日の並びのキャッシュのヒット数・ミス数（functools の CacheInfo）"""
+    return {
+        "min_contract_end_date": _cached_min_contract_end_date.cache_info(),
+        "declared_cancel_date": _cached_declared_cancel_date.cache_info(),
+        "cancellation_table": _cached_cancellation_table.cache_info(),
+        "renewal_schedule": _cached_renewal_schedule.cache_info(),
+    }
+
+
+def clear_contract_cache() -> None:
+    _cached_min_contract_end_date.cache_clear()
+    _cached_declared_cancel_date.cache_clear()
+    _cached_cancellation_table.cache_clear()
+    _cached_renewal_schedule.cache_clear()
+    with _latest_schedules_lock:
+        _latest_schedules.clear()
+
+
+def remaining_billing_months(declared_date, contract_end) -> int:
+    """解約申告日の月から契約終了日の月までの月数（両端を含む）。契約終了日が申告月より前なら0"""
+    if not contract_end:
+        return 0
+    months = month_ordinal(contract_end) - month_ordinal(declared_date) + 1
+    return max(0, months)
+
+
+# --- 配列版（NumPy）: 複数の契約を行ごとのループなしで一括計算する ---
+
+# datetime64[D] の 0 に対応する日序数（1970/01/01）
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# 日付が無い（計算不可）ことを表す日序数
+NO_DATE = 0
+# 契約番号と日序数を1つの整数キーにまとめるための倍率（date.max の日序数より大きい）
+_CONTRACT_KEY_STRIDE = 1 << 22
+# 平年の各月の日数
+_DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype='int64')
+
+
+def ordinals_to_datetime64(ordinals: np.ndarray) -> np.ndarray:
+    """日序数の配列を datetime64[D] にする（NO_DATE は NaT）"""
+    ordinals = np.asarray(ordinals, dtype='int64')
+    result = (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+    result[ordinals == NO_DATE] = np.datetime64('NaT')
+    return result
+
+
+def datetime64_to_ordinals(values) -> np.ndarray:
+    """datetime64 の配列を日序数にする（NaT は NO_DATE）"""
+    values = np.asarray(values, dtype='datetime64[D]')
+    result = values.astype('int64') + EPOCH_ORDINAL
+    result[np.isnat(values)] = NO_DATE
+    return result
+
+
+def _split_ordinals(ordinals: np.ndarray):
+    """日序数の配列を (datetime64[M] の月, 0始まりの日) に分ける"""
+    days = (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    return months, (days - months.astype('datetime64[D]')).astype('int64')
+
+
+def _days_in_months(months: np.ndarray) -> np.ndarray:
+    return ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype('int64')
+
+
+def _add_month_counts(ordinals: np.ndarray, months: np.ndarray) -> np.ndarray:
+    """要素ごとに異なる月数を加算する add_months の配列版"""
+    month_starts, day_index = _split_ordinals(ordinals)
+    target = month_starts + months.astype('timedelta64[M]')
+    day_index = np.minimum(day_index, _days_in_months(target) - 1)
+    return target.astype('datetime64[D]').astype('int64') + EPOCH_ORDINAL + day_index
+
+
+def add_months_array(ordinals: np.ndarray, months: int) -> np.ndarray:
+    """add_months の配列版。存在しない日は月末に丸める"""
+    return _add_month_counts(np.asarray(ordinals, dtype='int64'), np.asarray(months, dtype='int64'))
+
+
+def _month_end_ordinals(months: np.ndarray) -> np.ndarray:
+    """datetime64[M] の各月の末日を日序数で返す"""
+    return (np.asarray(months, dtype='datetime64[M]') + 1).astype('datetime64[D]').astype('int64') + EPOCH_ORDINAL - 1
+
+
+def _deadline_ordinals(renewal: np.ndarray) -> np.ndarray:
+    """更新日ごとの解約の申し出の締め切り（更新月の前月末の前日）を日序数で返す"""
+    renewal_month_start = (renewal - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]')
+    return renewal_month_start.astype('datetime64[D]').astype('int64') + EPOCH_ORDINAL - 2
+
+
+def _cancel_requests(contract_start: np.ndarray, cancel_year: np.ndarray, cancel_month: np.ndarray):
+    """
+    解約希望年月を検証し、(有効な契約のマスク, 希望月の月末, 最短解約日（申告日）) を返す（日付は日序数）。
+    有効なのは解約希望年月が1〜9999年・1〜12月で、契約開始日がある契約。無効な契約の最短解約日（申告日）は NO_DATE。
+    """
+    valid = (
+        (cancel_year >= 1) & (cancel_year <= 9999) & (cancel_month >= 1) & (cancel_month <= 12)
+        & (contract_start != NO_DATE)
+    )
+    requested_month = np.where(valid, (cancel_year - 1970) * 12 + (cancel_month - 1), 0).astype('datetime64[M]')
+    requested_eom = _month_end_ordinals(requested_month)
+    # 希望月の月末（契約開始日より前にはしない）
+    return valid, requested_eom, np.where(valid, np.maximum(requested_eom, contract_start), NO_DATE)
+
+
+def declared_cancel_ordinals(contract_start: np.ndarray, cancel_year: np.ndarray, cancel_month: np.ndarray) -> np.ndarray:
+    """calculate_declared_cancel_date の配列版。解約希望年月が不正な契約、契約開始日が無い契約は NO_DATE"""
+    return _cancel_requests(
+        np.asarray(contract_start, dtype='int64'), np.asarray(cancel_year, dtype='int64'), np.asarray(cancel_month, dtype='int64')
+    )[2]
+
+
+class HolidayLayout:
+    """
+    契約ごとに件数の異なる休業期間を、オフセット配列と区間配列で保持する（ragged layout）。
+    契約 i の休業期間は starts[offsets[i]:offsets[i+1]], ends[...]（結合済み・昇順の日序数）。
+    """
+
+    def __init__(self, offsets: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        self.offsets = np.asarray(offsets, dtype='int64')
+        self.starts = np.asarray(starts, dtype='int64')
+        self.ends = np.asarray(ends, dtype='int64')
+        contract_index = np.repeat(np.arange(len(self.offsets) - 1, dtype='int64'), np.diff(self.offsets))
+        self._start_keys = contract_index * _CONTRACT_KEY_STRIDE + self.starts
+        self._end_keys = contract_index * _CONTRACT_KEY_STRIDE + self.ends
+        self._cumulative = np.concatenate(([0], np.cumsum(self.ends - self.starts + 1)))
+
+    @classmethod
+    def from_arrays(cls, contract_count: int, contract_index, starts, ends):
+        """(契約番号, 開始日序数, 終了日序数) の配列から作る。契約ごとに重複・連続する期間を結合する"""
+        contract_index = np.asarray(contract_index, dtype='int64')
+        starts = np.asarray(starts, dtype='int64')
+        ends = np.asarray(ends, dtype='int64')
+        keep = starts <= ends
+        start_keys = contract_index[keep] * _CONTRACT_KEY_STRIDE + starts[keep]
+        end_keys = contract_index[keep] * _CONTRACT_KEY_STRIDE + ends[keep]
+        order = np.argsort(start_keys, kind='stable')
+        start_keys = start_keys[order]
+        end_keys = end_keys[order]
+        if len(start_keys):
+            # それまでの区間の最大終了日+1より後に始まる区間が新しい結合区間の先頭（契約が変わると必ず先頭になる）
+            reach = np.maximum.accumulate(end_keys)
+            first = np.ones(len(start_keys), dtype=bool)
+            first[1:] = start_keys[1:] > reach[:-1] + 1
+            group_heads = np.flatnonzero(first)
+            merged_start_keys = start_keys[group_heads]
+            merged_end_keys = np.maximum.reduceat(end_keys, group_heads)
+        else:
+            merged_start_keys = merged_end_keys = np.zeros(0, dtype='int64')
+        merged_contract = merged_start_keys // _CONTRACT_KEY_STRIDE
+        offsets = np.searchsorted(merged_contract, np.arange(contract_count + 1), side='left')
+        return cls(
+            offsets,
+            merged_start_keys - merged_contract * _CONTRACT_KEY_STRIDE,
+            merged_end_keys - merged_contract * _CONTRACT_KEY_STRIDE,
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def days_through(self, contract_index: np.ndarray, ordinals: np.ndarray) -> np.ndarray:
+        """各契約について、日序数 ordinals 以前（当日を含む）の休業日数"""
+        j = np.searchsorted(self._start_keys, contract_index * _CONTRACT_KEY_STRIDE + ordinals, side='right')
+        first = self.offsets[contract_index]
+        days = self._cumulative[j] - self._cumulative[first]
+        has_previous = j > first
+        last_end = self.ends[np.maximum(j - 1, 0)] if len(self.ends) else np.zeros_like(j)
+        partial = has_previous & (last_end > ordinals)
+        return days - np.where(partial, last_end - ordinals, 0)
+
+    def overlap_days(self, contract_index: np.ndarray, start_ordinals: np.ndarray, end_ordinals: np.ndarray) -> np.ndarray:
+        """各契約について、start〜end（両端を含む）に含まれる休業日数"""
+        days = self.days_through(contract_index, end_ordinals) - self.days_through(contract_index, start_ordinals - 1)
+        return np.where(start_ordinals <= end_ordinals, days, 0)
+
+    def next_holiday_start(self, contract_index: np.ndarray, ordinals: np.ndarray) -> np.ndarray:
+        """各契約について、ordinals 以降に掛かる最初の休業期間の開始日（無ければ大きな値）"""
+        i = np.searchsorted(self._end_keys, contract_index * _CONTRACT_KEY_STRIDE + ordinals, side='left')
+        in_contract = i < self.offsets[contract_index + 1]
+        candidate = self.starts[np.minimum(i, len(self.starts) - 1)] if len(self.starts) else np.zeros_like(i)
+        return np.where(in_contract, candidate, np.iinfo('int64').max // 2)
+
+
+def _stable_cycle_day(ordinals: np.ndarray) -> np.ndarray:
+    """_cycle_day_is_stable の配列版"""
+    months, day_index = _split_ordinals(ordinals)
+    month_number = months.astype('int64') % 12 # 0 = 1月
+    other_month = (month_number + RENEWAL_CYCLE_MONTHS) % 12
+    no_february = (month_number != 1) & (other_month != 1)
+    return (day_index < 28) | (no_february & (day_index < _DAYS_IN_MONTH[other_month]))
+
+
+def _holiday_free_cycles_array(cycle_starts: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """_holiday_free_cycles の配列版"""
+    start_months, start_days = _split_ordinals(cycle_starts)
+    bound_months, bound_days = _split_ordinals(np.minimum(bounds, date.max.toordinal()))
+    months_between = (bound_months - start_months).astype('int64') - (start_days >= bound_days)
+    return np.maximum(0, months_between // RENEWAL_CYCLE_MONTHS)
+
+
+def next_renewal_ordinals(contract_start: np.ndarray, reference: np.ndarray, layout: HolidayLayout,
+                          contract_index: np.ndarray = None) -> np.ndarray:
+    """
+    next_renewal_ordinal の配列版。各契約の reference 以降（当日を含む）で最初に到来する更新日を日序数で返す。
+    ループはサイクル単位で、各反復で未確定の契約すべてをまとめて1サイクル進める（休業日なしの区間は読み飛ばす）。
+    """
+    contract_start = np.asarray(contract_start, dtype='int64')
+    if contract_index is None:
+        contract_index = np.arange(len(contract_start), dtype='int64')
+    threshold = np.maximum(np.asarray(reference, dtype='int64'), contract_start)
+    cycle_start = contract_start.copy()
+    renewal = np.full(len(contract_start), NO_DATE, dtype='int64')
+    pending = np.arange(len(contract_start))
+
+    while len(pending):
+        c = cycle_start[pending]
+        idx = contract_index[pending]
+        limit = threshold[pending]
+
+        # 休業期間に掛からず、基準日にも届かないサイクルはまとめて読み飛ばす
+        bound = np.minimum(limit, layout.next_holiday_start(idx, c) + 1)
+        skip = np.where(_stable_cycle_day(c), _holiday_free_cycles_array(c, bound), 0)
+        if skip.any():
+            c = np.where(skip > 0, _add_month_counts(c, RENEWAL_CYCLE_MONTHS * skip), c)
+
+        projected = add_months_array(c, RENEWAL_CYCLE_MONTHS)
+        actual = projected + layout.overlap_days(idx, c, projected - 1)
+
+        done = actual >= limit
+        renewal[pending[done]] = actual[done]
+        cycle_start[pending[~done]] = actual[~done]
+        pending = pending[~done]
+    return renewal
+
+
+def min_contract_end_ordinals(contract_start: np.ndarray, cancel_year: np.ndarray, cancel_month: np.ndarray,
+                              apply_cancellation_rule: np.ndarray, layout: HolidayLayout) -> np.ndarray:
+    """
+    calculate_min_contract_end_date の配列版。N件の契約の最短解約日（契約期間）を日序数で返す。
+    解約希望年月が不正な契約、契約開始日が無い契約は NO_DATE とする。
+    """
+    contract_start = np.asarray(contract_start, dtype='int64')
+    cancel_year = np.asarray(cancel_year, dtype='int64')
+    cancel_month = np.asarray(cancel_month, dtype='int64')
+    apply_cancellation_rule = np.asarray(apply_cancellation_rule, dtype=bool)
+
+    # ルールを適用しない場合: 最短解約日（申告日）と同じ
+    valid, requested_eom, result = _cancel_requests(contract_start, cancel_year, cancel_month)
+
+    ruled = np.flatnonzero(valid & apply_cancellation_rule)
+    if len(ruled):
+        start = contract_start[ruled]
+        eom = requested_eom[ruled]
+        renewal = next_renewal_ordinals(start, np.maximum(start, eom + 1), layout, ruled)
+
+        in_time = eom <= _deadline_ordinals(renewal)
+
+        end = renewal - 1
+        late = np.flatnonzero(~in_time)
+        if len(late):
+            # 間に合わない場合は次の更新サイクルの最終日まで継続
+            end[late] = next_renewal_ordinals(start[late], renewal[late] + 1, layout, ruled[late]) - 1
+        result[ruled] = end
+    # calculate_min_contract_end_date と同じく、9999年12月31日より後になる場合は計算できないものとする
+    result[result > date.max.toordinal()] = NO_DATE
+    return result
+
+
+def renewal_schedule_ordinals(contract_start: np.ndarray, first_reference: np.ndarray, last_reference: int,
+                              layout: HolidayLayout, contract_index: np.ndarray = None) -> np.ndarray:
+    """
+    各契約の first_reference 以降（当日を含む）の更新日を昇順に並べた (N, J) の配列。
+    どの契約も last_reference 以降の最初の更新日と、そのさらに次の更新日までを含む。
+    更新日 r の次の更新日は、r を契約開始日とみなした最初の更新日と同じなので、1列ずつ前の列から求める。
+    """
+    contract_start = np.asarray(contract_start, dtype='int64')
+    if contract_index is None:
+        contract_index = np.arange(len(contract_start), dtype='int64')
+    columns = [next_renewal_ordinals(contract_start, first_reference, layout, contract_index)]
+    while len(columns) < 2 or (len(contract_start) and columns[-2].min() < last_reference):
+        columns.append(next_renewal_ordinals(columns[-1], columns[-1] + 1, layout, contract_index))
+    return np.stack(columns, axis=1)
+
+
+def min_contract_end_sweep(contract_start: np.ndarray, sweep_months: np.ndarray,
+                           apply_cancellation_rule: np.ndarray, layout: HolidayLayout) -> np.ndarray:
+    """
+    N件の契約それぞれについて、sweep_months（datetime64[M] の K ヶ月）の各月を解約希望月とした
+    最短解約日（契約期間）を (N, K) の日序数で返す。値は月ごとに min_contract_end_ordinals を呼んだ場合と同じ。
+    更新日の並びは契約ごとに一度だけ求め、全ての月で二分探索して使い回す。契約開始日が無い契約は NO_DATE。
+    """
+    contract_start = np.asarray(contract_start, dtype='int64')
+    apply_cancellation_rule = np.asarray(apply_cancellation_rule, dtype=bool)
+    sweep_months = np.asarray(sweep_months, dtype='datetime64[M]')
+    requested_eom = _month_end_ordinals(sweep_months)
+    valid = contract_start != NO_DATE
+
+    # ルールを適用しない場合: 希望月の月末（契約開始日より前にはしない）
+    result = np.maximum(requested_eom[np.newaxis, :], contract_start[:, np.newaxis])
+    result[~valid] = NO_DATE
+
+    ruled = np.flatnonzero(valid & apply_cancellation_rule)
+    if len(ruled) and len(sweep_months):
+        start = contract_start[ruled]
+        schedule = renewal_schedule_ordinals(
+            start, np.maximum(start, requested_eom.min() + 1), int(requested_eom.max()) + 1, layout, ruled
+        )
+        # 契約ごとの更新日を1本の昇順キーに並べ、各月の基準日を二分探索する
+        rows = np.arange(len(ruled), dtype='int64')[:, np.newaxis]
+        flat_schedule = schedule.ravel()
+        schedule_keys = (rows * _CONTRACT_KEY_STRIDE + schedule).ravel()
+        threshold = np.maximum(start[:, np.newaxis], requested_eom[np.newaxis, :] + 1)
+        position = np.searchsorted(schedule_keys, rows * _CONTRACT_KEY_STRIDE + threshold, side='left')
+        renewal = flat_schedule[position]
+        following = flat_schedule[position + 1]
+
+        # 締め切りに間に合わない場合は次の更新サイクルの最終日まで継続
+        result[ruled] = np.where(requested_eom[np.newaxis, :] <= _deadline_ordinals(renewal), renewal, following) - 1
+    return result
+
+
+def remaining_months_array(declared_months: np.ndarray, contract_end: np.ndarray) -> np.ndarray:
+    """remaining_billing_months の配列版。declared_months は datetime64[M]、contract_end は日序数（NO_DATE は0ヶ月）"""
+    end_months = (np.asarray(contract_end, dtype='int64') - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]')
+    months = (end_months - np.asarray(declared_months, dtype='datetime64[M]')).astype('int64') + 1
+    return np.where(np.asarray(contract_end) == NO_DATE, 0, np.maximum(months, 0))
+
+
+class CancellationTable:
+    """
+    1件の契約について、first_year の1月から months ヶ月の各解約希望月に対する最短解約日（契約期間・申告日）を
+    まとめて計算しておく早見表。解約希望年月の変更は配列を引くだけ（O(1)）で答えられる。
+    更新日は契約ごとに共有する RenewalSchedule から引くので、休業期間を変更した場合も変更日より前の更新日は計算し直さない。
+    """
+
+    def __init__(self, contract_start, holidays, apply_cancellation_rule: bool, first_year: int,
+                 months: int = CANCEL_LOOKUP_YEARS * 12):
+        start_ord = to_ordinal(contract_start)
+        self.first_month_index = first_year * 12
+        self.months = np.datetime64(f"{first_year:04d}-01", 'M') + np.arange(months)
+        requested_eom = _month_end_ordinals(self.months)
+        self.declared_cancel = np.maximum(requested_eom, start_ord)
+        if not apply_cancellation_rule:
+            # 希望月の月末をそのまま解約日とする（契約開始日より前にはしない）
+            self.contract_end = self.declared_cancel.copy()
+            return
+
+        # 最後の月の基準日以降の更新日と、そのさらに次の更新日まで並びを伸ばしてから、各月の基準日を二分探索する
+        schedule = renewal_schedule(start_ord, holidays)
+        threshold = np.maximum(start_ord, requested_eom + 1)
+        schedule.next_renewal(schedule.next_renewal(int(threshold.max())) + 1)
+        boundaries = np.asarray(schedule.boundaries, dtype='int64')
+        position = np.searchsorted(boundaries, threshold, side='left')
+        renewal = boundaries[position]
+        following = boundaries[position + 1]
+
+        # 締め切りに間に合わない場合は次の更新サイクルの最終日まで継続
+        self.contract_end = np.where(requested_eom <= _deadline_ordinals(renewal), renewal, following) - 1
+
+    def __len__(self):
+        return len(self.months)
+
+    def _position(self, cancel_year: int, cancel_month: int):
+        if not 1 <= cancel_month <= 12:
+            return None
+        position = cancel_year * 12 + cancel_month - 1 - self.first_month_index
+        return position if 0 <= position < len(self) else None
+
+    def lookup(self, cancel_year: int, cancel_month: int):
+        """(最短解約日（契約期間）, 最短解約日（申告日）)。表の範囲外の年月は None"""
+        position = self._position(cancel_year, cancel_month)
+        if position is None:
+            return None
+        return date.fromordinal(int(self.contract_end[position])), date.fromordinal(int(self.declared_cancel[position]))
+
+    def remaining_months(self, declared_date) -> np.ndarray:
+        """解約申告日が declared_date の場合の、各解約希望月の残存月数"""
+        return remaining_months_array(np.datetime64(date.fromordinal(to_ordinal(declared_date)), 'M'), self.contract_end)
+
+
+def cancellation_table(contract_start, holidays, apply_cancellation_rule: bool, first_year: int) -> CancellationTable:
+    """契約の入力（開始日・休業期間・ルール）ごとに CancellationTable を一度だけ作り、プロセス全体でキャッシュする"""
+    # ルールを適用しない場合、休業期間は結果に影響しないのでキーに含めない
+    holiday_key = HolidayCalendar.coerce(holidays).key if apply_cancellation_rule else ()
+    return _cached_cancellation_table(to_ordinal(contract_start), holiday_key, bool(apply_cancellation_rule), int(first_year))
+
+
+@lru_cache(maxsize=CANCELLATION_TABLE_CACHE_SIZE)
+def _cached_cancellation_table(start_ord: int, holiday_key: tuple, apply_cancellation_rule: bool, first_year: int):
+    return CancellationTable(start_ord, holiday_key, apply_cancellation_rule, first_year)
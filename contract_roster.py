@@ -0,0 +1,303 @@
+import io
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from contract_engine import (
+    NO_DATE,
+    HolidayLayout,
+    datetime64_to_ordinals,
+    declared_cancel_ordinals,
+    min_contract_end_ordinals,
+    min_contract_end_sweep,
+    ordinals_to_datetime64,
+    remaining_months_array,
+)
+
+# 契約リストCSVのカラム
+ROSTER_ID_COLUMN = '契約ID'
+ROSTER_START_COLUMN = '契約開始日'
+ROSTER_HOLIDAYS_COLUMN = '休業期間'
+ROSTER_DECLARED_COLUMN = '解約申告日'
+ROSTER_CANCEL_YEAR_COLUMN = '解約希望年'
+ROSTER_CANCEL_MONTH_COLUMN = '解約希望月'
+ROSTER_UNIT_PRICE_COLUMN = '請求単価'
+ROSTER_RULE_COLUMN = 'ルール適用' # 省略時は「更新月の1ヶ月前までの申し出で解約可能」ルールを適用
+ROSTER_REQUIRED_COLUMNS = (
+    ROSTER_START_COLUMN,
+    ROSTER_DECLARED_COLUMN,
+    ROSTER_CANCEL_YEAR_COLUMN,
+    ROSTER_CANCEL_MONTH_COLUMN,
+    ROSTER_UNIT_PRICE_COLUMN,
+)
+
+# 計算結果のカラム
+RESULT_CONTRACT_END_COLUMN = '最短解約日（契約期間）'
+RESULT_DECLARED_CANCEL_COLUMN = '最短解約日（申告日）'
+RESULT_REMAINING_MONTHS_COLUMN = '残存月数'
+RESULT_PAYMENT_PLAN_COLUMN = '支払計画'
+
+# 休業期間の書式: "2024/01/01〜2024/01/31, 2024/05/01〜2024/05/10"（計算結果の「◆ 休業期間」と同じ）
+_HOLIDAY_SEPARATOR = re.compile(r'[,、;]')
+_HOLIDAY_RANGE_SEPARATOR = re.compile(r'[〜～~]')
+# 貼り付けたCSVの1行（"2024/01/01,2024/01/31" など）の区切り
+_HOLIDAY_LINE_SEPARATOR = re.compile(r'[,\t〜～~]')
+
+_FALSE_VALUES = {'0', 'false', 'no', 'off', 'いいえ', '否', '×', 'なし'}
+
+_ROSTER_TEXT_DTYPES = {ROSTER_HOLIDAYS_COLUMN: str, ROSTER_RULE_COLUMN: str}
+
+# 契約リストを分割して読み込む場合の1回あたりの行数
+ROSTER_STREAM_CHUNK_ROWS = 100_000
+
+# 解約申告月シミュレーションの既定の月数
+SWEEP_HORIZON_MONTHS = 24
+
+# 並列計算で1プロセスに渡す最小行数（これより細かく分けるとプロセス間の受け渡しの負荷が勝る）
+PARALLEL_MIN_CHUNK_ROWS = 20_000
+# 1ワーカーあたりのチャンク数（処理時間のばらつきを均すため少し多めに分ける）
+PARALLEL_CHUNKS_PER_WORKER = 2
+
+
+def parse_holiday_lines(text: str) -> list:
+    """
+    1行に1期間ずつ「開始日,終了日」（タブ区切り・「〜」区切りも可）を並べたテキストを [(開始日, 終了日), ...] にする。
+    Excelなどから貼り付けたCSV向け。1行目が見出し（数字を含まない行）なら読み飛ばす。
+    読み取れない行や開始日が終了日より後の行がある場合は、その行番号を含む ValueError
+    """
+    periods = []
+    bad_lines = []
+    for line_number, line in enumerate((text or '').splitlines(), start=1):
+        if not line.strip() or (line_number == 1 and not any(c.isdigit() for c in line)):
+            continue
+        parts = [part.strip() for part in _HOLIDAY_LINE_SEPARATOR.split(line.strip()) if part.strip()]
+        try:
+            if len(parts) != 2:
+                raise ValueError(line)
+            start, end = (pd.to_datetime(part).date() for part in parts)
+        except ValueError:
+            bad_lines.append(line_number)
+            continue
+        if start > end: # 結合の際に黙って捨てられないよう、編集表の行と同じく不正な行として扱う
+            bad_lines.append(line_number)
+            continue
+        periods.append((start, end))
+    if bad_lines:
+        raise ValueError(f"休業期間を読み取れない、または開始日が終了日より後の行があります: {', '.join(map(str, bad_lines))}行目")
+    return periods
+
+
+def holiday_layout_from_texts(holiday_texts) -> HolidayLayout:
+    """
+    契約ごとの休業期間の文字列（「開始日〜終了日」のカンマ区切り。空欄・「設定なし」は休業期間なし）をまとめて HolidayLayout にする。
+    文字列の分割と日付の解析は全契約分を一度に行う。書式が正しくない行、開始日が終了日より後の期間がある行は ValueError。
+    """
+    texts = pd.Series(list(holiday_texts), dtype=object)
+    parts = texts.str.split(_HOLIDAY_SEPARATOR).explode().str.strip()
+    parts = parts[parts.notna() & (parts != '') & (parts != '設定なし')]
+    bounds = parts.str.split(_HOLIDAY_RANGE_SEPARATOR, n=1, expand=True).reindex(columns=[0, 1]).astype(object)
+    starts = _parse_dates(bounds[0])
+    ends = _parse_dates(bounds[1])
+    # 開始日が終了日より後の期間は HolidayLayout で黙って捨てられるため、書式の誤りと同じく行番号を示して拒否する
+    invalid = starts.isna() | ends.isna() | (starts > ends)
+    if invalid.any():
+        rows = sorted(set(int(i) + 1 for i in parts.index[invalid.to_numpy()]))[:5]
+        raise ValueError(
+            f"休業期間の書式が正しくないか、開始日が終了日より後です（{', '.join(map(str, rows))}行目）。例: 2024/01/01〜2024/01/31"
+        )
+    return HolidayLayout.from_arrays(
+        len(texts),
+        parts.index.to_numpy(dtype='int64'),
+        datetime64_to_ordinals(starts.to_numpy(dtype='datetime64[D]')),
+        datetime64_to_ordinals(ends.to_numpy(dtype='datetime64[D]')),
+    )
+
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    values = values.str.strip()
+    parsed = pd.to_datetime(values, errors='coerce')
+    if (parsed.isna() & values.notna()).any():
+        # 書式が混在している場合は1件ずつ書式を推定し直す
+        parsed = pd.to_datetime(values, errors='coerce', format='mixed')
+    return parsed
+
+
+def _parse_rule_flags(values: pd.Series) -> np.ndarray:
+    return ~values.fillna('').astype(str).str.strip().str.lower().isin(_FALSE_VALUES).to_numpy()
+
+
+def _normalize_roster(roster: pd.DataFrame) -> pd.DataFrame:
+    missing = [c for c in ROSTER_REQUIRED_COLUMNS if c not in roster.columns]
+    if missing:
+        raise ValueError(f"契約リストに必須カラムがありません: {', '.join(missing)}")
+    roster[ROSTER_START_COLUMN] = pd.to_datetime(roster[ROSTER_START_COLUMN], errors='coerce')
+    roster[ROSTER_DECLARED_COLUMN] = pd.to_datetime(roster[ROSTER_DECLARED_COLUMN], errors='coerce')
+    for column in (ROSTER_CANCEL_YEAR_COLUMN, ROSTER_CANCEL_MONTH_COLUMN, ROSTER_UNIT_PRICE_COLUMN):
+        # 空欄・数値でない値・整数でない値は欠損（<NA>）のまま残し、0 として計算しない
+        values = pd.to_numeric(roster[column], errors='coerce')
+        values = values.where((values == values.round()) & (values.abs() < 2 ** 53))
+        roster[column] = values.astype('Int64')
+    return roster
+
+
+def read_roster_csv(source) -> pd.DataFrame:
+    """契約リストCSVを読み込み、日付・年月・単価の型を揃える。必須カラムが無い場合は ValueError"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return _normalize_roster(pd.read_csv(source, dtype=_ROSTER_TEXT_DTYPES))
+
+
+def iter_roster_csv(source, chunk_rows: int = ROSTER_STREAM_CHUNK_ROWS):
+    """契約リストCSVを chunk_rows 行ずつ読み込み、型を揃えたDataFrameを順に返す（大きなファイル向け）"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with pd.read_csv(source, dtype=_ROSTER_TEXT_DTYPES, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield _normalize_roster(chunk)
+
+
+def _roster_inputs(roster: pd.DataFrame) -> dict:
+    """計算に必要なカラムだけを配列として取り出す（並列計算ではこれだけをプロセス間で受け渡す）"""
+    if ROSTER_RULE_COLUMN in roster.columns:
+        apply_rule = _parse_rule_flags(roster[ROSTER_RULE_COLUMN])
+    else:
+        apply_rule = np.ones(len(roster), dtype=bool)
+    if ROSTER_HOLIDAYS_COLUMN in roster.columns:
+        holiday_texts = roster[ROSTER_HOLIDAYS_COLUMN].tolist()
+    else:
+        holiday_texts = [None] * len(roster)
+    return {
+        'start': roster[ROSTER_START_COLUMN].to_numpy(dtype='datetime64[D]'),
+        'declared': roster[ROSTER_DECLARED_COLUMN].to_numpy(dtype='datetime64[D]'),
+        # 欠損した年月は 0（不正な年月として日付を NaT にする）、欠損した単価は NaN（支払計画を欠損にする）
+        'cancel_year': roster[ROSTER_CANCEL_YEAR_COLUMN].to_numpy(dtype='int64', na_value=0),
+        'cancel_month': roster[ROSTER_CANCEL_MONTH_COLUMN].to_numpy(dtype='int64', na_value=0),
+        'unit_price': roster[ROSTER_UNIT_PRICE_COLUMN].to_numpy(dtype='float64', na_value=np.nan),
+        'apply_rule': apply_rule,
+        'holiday_texts': holiday_texts,
+    }
+
+
+def _compute_roster_arrays(inputs: dict) -> dict:
+    start = datetime64_to_ordinals(inputs['start'])
+    declared = inputs['declared']
+    cancel_year = inputs['cancel_year']
+    cancel_month = inputs['cancel_month']
+
+    # 最短解約日（申告日）: 希望月の月末（契約開始日より前にはしない）
+    declared_cancel = ordinals_to_datetime64(declared_cancel_ordinals(start, cancel_year, cancel_month))
+
+    # 最短解約日（契約期間）: 休業期間を契約ごとの区間配列にまとめ、全契約を配列エンジンで一括計算する
+    layout = holiday_layout_from_texts(inputs['holiday_texts'])
+    contract_end_ordinals = min_contract_end_ordinals(start, cancel_year, cancel_month, inputs['apply_rule'], layout)
+    contract_end = ordinals_to_datetime64(contract_end_ordinals)
+
+    # 残存月数: 解約申告日の月から契約終了日の月まで（両端を含む）
+    # 最短解約日（契約期間）や解約申告日が求まらない行は「0ヶ月」ではなく欠損（NaN、結果では <NA>）にする
+    remaining = np.where(
+        np.isnat(contract_end) | np.isnat(declared),
+        np.nan,
+        remaining_months_array(declared.astype('datetime64[M]'), contract_end_ordinals),
+    )
+
+    return {
+        RESULT_CONTRACT_END_COLUMN: contract_end,
+        RESULT_DECLARED_CANCEL_COLUMN: declared_cancel,
+        RESULT_REMAINING_MONTHS_COLUMN: remaining,
+        RESULT_PAYMENT_PLAN_COLUMN: inputs['unit_price'] * remaining,
+    }
+
+
+def _attach_results(roster: pd.DataFrame, results: dict) -> pd.DataFrame:
+    result = roster.copy()
+    for column, values in results.items():
+        result[column] = values
+    # 計算できない行の残存月数・支払計画は空欄にする（それ以外は整数）
+    for column in (RESULT_REMAINING_MONTHS_COLUMN, RESULT_PAYMENT_PLAN_COLUMN):
+        result[column] = result[column].astype('Int64')
+    return result
+
+
+def compute_roster(roster: pd.DataFrame) -> pd.DataFrame:
+    """
+    契約リストの全行について、最短解約日（契約期間）・最短解約日（申告日）・残存月数・支払計画を計算する。
+    日付の計算は行ごとのループを使わず、配列演算で一括して行う。契約開始日・解約希望年月が空欄・不正な行の日付は NaT、
+    それらの行と解約申告日が空欄・不正な行の残存月数・支払計画は欠損（<NA>）となる。請求単価が空欄・不正な行の支払計画も <NA>。
+    """
+    return _attach_results(roster, _compute_roster_arrays(_roster_inputs(roster)))
+
+
+def roster_sweep(roster: pd.DataFrame, first_month: date, months: int = SWEEP_HORIZON_MONTHS):
+    """
+    first_month から months ヶ月の各月について、その月の1日に解約を申告し、その月末での解約を希望した場合の
+    残存月数と支払計画を計算する。戻り値は (残存月数, 支払計画) の2つの表（行: 契約ID、列: 申告月）。
+    全ての月を1回の配列計算で求め、各契約の更新日の並びは月をまたいで共有する。
+    契約開始日が空欄・不正な契約の値は、全ての月で欠損（<NA>）とする。
+    """
+    inputs = _roster_inputs(roster)
+    sweep_months = np.datetime64(first_month, 'M') + np.arange(months)
+    layout = holiday_layout_from_texts(inputs['holiday_texts'])
+    contract_end = min_contract_end_sweep(
+        datetime64_to_ordinals(inputs['start']), sweep_months, inputs['apply_rule'], layout
+    )
+    remaining = np.where(
+        contract_end == NO_DATE, np.nan, remaining_months_array(sweep_months[np.newaxis, :], contract_end)
+    )
+
+    index = roster[ROSTER_ID_COLUMN] if ROSTER_ID_COLUMN in roster.columns else roster.index
+    index = pd.Index(index, name=ROSTER_ID_COLUMN)
+    columns = pd.DatetimeIndex(sweep_months.astype('datetime64[D]')).strftime('%Y年%m月')
+    remaining_table = pd.DataFrame(remaining, index=index, columns=columns).astype('Int64')
+    payment_table = pd.DataFrame(remaining * inputs['unit_price'][:, np.newaxis], index=index, columns=columns).astype('Int64')
+    return remaining_table, payment_table
+
+
+def _slice_inputs(inputs: dict, start: int, stop: int) -> dict:
+    return {name: values[start:stop] for name, values in inputs.items()}
+
+
+def parallel_chunk_rows(row_count: int, workers: int) -> int:
+    """並列計算で1チャンクに含める行数（ワーカーあたり PARALLEL_CHUNKS_PER_WORKER 個、最小 PARALLEL_MIN_CHUNK_ROWS 行）"""
+    return max(PARALLEL_MIN_CHUNK_ROWS, math.ceil(row_count / (workers * PARALLEL_CHUNKS_PER_WORKER)))
+
+
+def roster_process_pool(workers: int) -> ProcessPoolExecutor:
+    """契約リストの並列計算用のプロセスプール（Streamlitのサーバーはスレッドを使っているため fork ではなく spawn で起動する）"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def compute_roster_parallel(roster: pd.DataFrame, workers: int = None, chunk_rows: int = None,
+                            executor: ProcessPoolExecutor = None) -> pd.DataFrame:
+    """
+    compute_roster をプロセスプールで並列に実行する。契約リストを行のまとまりに分けて各プロセスで計算し、
+    元の行順で結合する（結果は compute_roster と同じ）。workers を省略するとCPU数、1以下なら並列化しない。
+    executor を渡すと、呼び出しごとにプロセスを起動せずそのプールを使う（バッチ処理で繰り返し呼ぶ場合）。
+    """
+    workers = workers or os.cpu_count() or 1
+    inputs = _roster_inputs(roster)
+    chunk_rows = chunk_rows or parallel_chunk_rows(len(roster), workers)
+    if workers <= 1 or len(roster) <= chunk_rows:
+        return _attach_results(roster, _compute_roster_arrays(inputs))
+
+    chunks = [_slice_inputs(inputs, i, i + chunk_rows) for i in range(0, len(roster), chunk_rows)]
+    if executor is not None:
+        chunk_results = list(executor.map(_compute_roster_arrays, chunks)) # map は投入順に結果を返す
+    else:
+        with roster_process_pool(min(workers, len(chunks))) as pool:
+            chunk_results = list(pool.map(_compute_roster_arrays, chunks))
+    results = {
+        column: np.concatenate([chunk_result[column] for chunk_result in chunk_results])
+        for column in chunk_results[0]
+    }
+    return _attach_results(roster, results)
+
+
+def roster_to_csv_bytes(result: pd.DataFrame) -> bytes:
+    """計算結果をExcelで開けるCSV（UTF-8 BOM付き、日付は YYYY/MM/DD）にする"""
+    return result.to_csv(index=False, date_format='%Y/%m/%d').encode('utf-8-sig')
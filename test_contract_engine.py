@@ -0,0 +1,250 @@
+"""
+contract_engine の計算結果を、置き換える前の実装（pandasで1サイクルずつ進めるループ、app4.py の1日ずつ数えるループ）と
+ランダムな契約で突き合わせる。月末（29〜31日）開始の契約や、更新日に掛かる休業期間も含める。
+
+    python -m pytest -q test_contract_engine.py
+"""
+import calendar
+import random
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from contract_engine import (
+    CancellationTable,
+    HolidayCalendar,
+    HolidayLayout,
+    add_non_holiday_days,
+    calculate_declared_cancel_date,
+    calculate_min_contract_end_date,
+    clear_contract_cache,
+    holiday_extended_contract_end,
+    min_contract_end_ordinals,
+    min_contract_end_sweep,
+    next_renewal_ordinal,
+    skip_holidays,
+)
+
+SEEDS = range(4)
+CASES_PER_SEED = 60
+
+
+# --- 置き換える前の実装（app24.py のpandas版、app4.py の1日ずつ数える版をそのまま残したもの） ---
+
+def _baseline_holiday_days(start_dt, end_dt, holiday_periods):
+    total = 0
+    for h_start, h_end in holiday_periods:
+        overlap_start = max(start_dt, pd.to_datetime(h_start))
+        overlap_end = min(end_dt, pd.to_datetime(h_end))
+        if overlap_start <= overlap_end:
+            total += (overlap_end - overlap_start).days + 1
+    return total
+
+
+def _baseline_next_renewal(contract_start_ts, reference_ts, holiday_periods):
+    cycle_start = contract_start_ts
+    reference_ts = max(reference_ts, contract_start_ts)
+    while True:
+        projected_renewal = cycle_start + pd.DateOffset(months=6)
+        holidays_in_cycle = _baseline_holiday_days(cycle_start, projected_renewal - pd.Timedelta(days=1), holiday_periods)
+        actual_renewal = projected_renewal + pd.Timedelta(days=holidays_in_cycle)
+        if actual_renewal >= reference_ts:
+            return actual_renewal
+        cycle_start = actual_renewal
+
+
+def _baseline_min_contract_end(start_ts, cancel_year, cancel_month, holiday_periods, apply_cancellation_rule):
+    try:
+        requested_eom = pd.to_datetime(datetime(cancel_year, cancel_month, 1)).to_period('M').end_time
+        if not apply_cancellation_rule:
+            return max(requested_eom, start_ts).date()
+        renewal = _baseline_next_renewal(start_ts, max(start_ts, requested_eom), holiday_periods)
+        deadline = (renewal - pd.DateOffset(months=1)).to_period('M').end_time - pd.Timedelta(days=1)
+        if requested_eom <= deadline:
+            return (renewal - pd.Timedelta(days=1)).date()
+        next_renewal = _baseline_next_renewal(start_ts, renewal + pd.Timedelta(days=1), holiday_periods)
+        return (next_renewal - pd.Timedelta(days=1)).date()
+    except ValueError:
+        return None
+
+
+def _baseline_declared_cancel(start_ts, cancel_year, cancel_month):
+    try:
+        requested_eom = pd.to_datetime(datetime(cancel_year, cancel_month, 1)).to_period('M').end_time
+        return max(requested_eom, start_ts).date()
+    except ValueError:
+        return None
+
+
+def _is_holiday(d, holidays):
+    return any(h_start <= d <= h_end for h_start, h_end in holidays)
+
+
+def _baseline_add_business_days(start_date, days_to_add, holidays):
+    current = start_date
+    while days_to_add > 0:
+        current += timedelta(days=1)
+        if not _is_holiday(current, holidays):
+            days_to_add -= 1
+    while _is_holiday(current, holidays):
+        current += timedelta(days=1)
+    return current
+
+
+def _baseline_app4_contract_end(start_date, today, holidays):
+    cycle_start = start_date
+    while True:
+        period_end_base = cycle_start + relativedelta(months=6, days=-1)
+        extension = 0
+        day = cycle_start
+        while day < period_end_base:
+            day += timedelta(days=1)
+            if _is_holiday(day, holidays):
+                extension += 1
+        contract_end = period_end_base + timedelta(days=extension)
+        while _is_holiday(contract_end, holidays):
+            contract_end += timedelta(days=1)
+        if contract_end >= today:
+            return contract_end
+        cycle_start = contract_end + timedelta(days=1)
+
+
+# --- ランダムな契約 ---
+
+def _random_contract(rng):
+    """契約開始日と、重ならない休業期間（結合済み）。3割は29〜31日（月末に丸められる日）に始まる契約にする"""
+    start = date(2015, 1, 1) + timedelta(days=rng.randint(0, 4000))
+    if rng.random() < 0.3:
+        year, month = rng.randint(2015, 2025), rng.randint(1, 12)
+        start = date(year, month, min(rng.choice([29, 30, 31]), calendar.monthrange(year, month)[1]))
+    holidays = []
+    cursor = start - timedelta(days=100)
+    for _ in range(rng.randint(0, 5)):
+        h_start = cursor + timedelta(days=rng.randint(2, 900))
+        h_end = h_start + timedelta(days=rng.randint(0, 60))
+        holidays.append((h_start, h_end))
+        cursor = h_end
+    return start, holidays
+
+
+def _random_cases(seed):
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(CASES_PER_SEED):
+        start, holidays = _random_contract(rng)
+        cancel_year = rng.randint(start.year - 1, start.year + 8)
+        cancel_month = rng.randint(1, 12) if rng.random() < 0.95 else 13
+        cases.append((start, holidays, cancel_year, cancel_month, rng.random() < 0.8))
+    return cases
+
+
+def _layout(holiday_lists):
+    contract_index, starts, ends = [], [], []
+    for i, holidays in enumerate(holiday_lists):
+        for h_start, h_end in holidays:
+            contract_index.append(i)
+            starts.append(h_start.toordinal())
+            ends.append(h_end.toordinal())
+    return HolidayLayout.from_arrays(len(holiday_lists), contract_index, starts, ends)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches():
+    clear_contract_cache()
+    yield
+    clear_contract_cache()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_next_renewal_matches_baseline_loop(seed):
+    rng = random.Random(seed)
+    for _ in range(CASES_PER_SEED):
+        start, holidays = _random_contract(rng)
+        reference = start + timedelta(days=rng.randint(-30, 4000))
+        expected = _baseline_next_renewal(pd.Timestamp(start), pd.Timestamp(reference), holidays).date()
+        assert date.fromordinal(next_renewal_ordinal(start, reference, holidays)) == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_scalar_engine_matches_baseline_loop(seed):
+    for start, holidays, cancel_year, cancel_month, rule in _random_cases(seed):
+        start_ts = pd.Timestamp(start)
+        assert calculate_min_contract_end_date(start, cancel_year, cancel_month, holidays, rule) == \
+            _baseline_min_contract_end(start_ts, cancel_year, cancel_month, holidays, rule)
+        assert calculate_declared_cancel_date(start, cancel_year, cancel_month) == \
+            _baseline_declared_cancel(start_ts, cancel_year, cancel_month)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_array_engine_matches_baseline_loop(seed):
+    cases = _random_cases(seed)
+    starts, holiday_lists, years, months, rules = zip(*cases)
+    result = min_contract_end_ordinals(
+        np.array([s.toordinal() for s in starts]), np.array(years), np.array(months), np.array(rules), _layout(holiday_lists)
+    )
+    for (start, holidays, cancel_year, cancel_month, rule), ordinal in zip(cases, result.tolist()):
+        expected = _baseline_min_contract_end(pd.Timestamp(start), cancel_year, cancel_month, holidays, rule)
+        assert (date.fromordinal(ordinal) if ordinal else None) == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_sweep_and_lookup_table_match_baseline_loop(seed):
+    rng = random.Random(seed)
+    contracts = [_random_contract(rng) for _ in range(CASES_PER_SEED // 4)]
+    rules = [rng.random() < 0.8 for _ in contracts]
+    first_year = 2020
+    sweep_months = np.datetime64(f"{first_year}-01", 'M') + np.arange(36)
+    sweep = min_contract_end_sweep(
+        np.array([start.toordinal() for start, _ in contracts]), sweep_months, np.array(rules),
+        _layout([holidays for _, holidays in contracts]),
+    )
+    for (start, holidays), rule, row in zip(contracts, rules, sweep.tolist()):
+        table = CancellationTable(start, holidays, rule, first_year, months=len(sweep_months))
+        for k, ordinal in enumerate(row):
+            cancel_year, cancel_month = first_year + k // 12, k % 12 + 1
+            expected = _baseline_min_contract_end(pd.Timestamp(start), cancel_year, cancel_month, holidays, rule)
+            assert date.fromordinal(ordinal) == expected
+            assert table.lookup(cancel_year, cancel_month)[0] == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_legacy_holiday_rules_match_day_by_day_loops(seed):
+    rng = random.Random(seed)
+    for _ in range(CASES_PER_SEED):
+        start, holidays = _random_contract(rng)
+        d = start + timedelta(days=rng.randint(0, 2000))
+        days_to_add = rng.randint(0, 400)
+        assert add_non_holiday_days(d, days_to_add, holidays) == _baseline_add_business_days(d, days_to_add, holidays)
+        expected_skip = d
+        while _is_holiday(expected_skip, holidays):
+            expected_skip += timedelta(days=1)
+        assert skip_holidays(d, holidays) == expected_skip
+
+        today = start + timedelta(days=rng.randint(0, 3000))
+        assert holiday_extended_contract_end(start, today, HolidayCalendar(holidays)) == \
+            _baseline_app4_contract_end(start, today, holidays)
+
+
+def test_month_end_starts_match_baseline_loop():
+    """29〜31日開始の契約で、休業期間のないサイクルをまとめて読み飛ばしても月末の丸めが1サイクルずつの場合と一致する"""
+    starts = [
+        date(year, month, day)
+        for year in (2019, 2020) for month in range(1, 13) for day in (28, 29, 30, 31)
+        if day <= calendar.monthrange(year, month)[1]
+    ]
+    holiday_lists = [[] if i % 2 else [(start + timedelta(days=1500), start + timedelta(days=1510))] for i, start in enumerate(starts)]
+    cancel_year, cancel_month = 2027, 4
+    result = min_contract_end_ordinals(
+        np.array([s.toordinal() for s in starts]), np.full(len(starts), cancel_year), np.full(len(starts), cancel_month),
+        np.ones(len(starts), dtype=bool), _layout(holiday_lists),
+    )
+    for start, holidays, ordinal in zip(starts, holiday_lists, result.tolist()):
+        expected = _baseline_min_contract_end(pd.Timestamp(start), cancel_year, cancel_month, holidays, True)
+        assert calculate_min_contract_end_date(start, cancel_year, cancel_month, holidays, True) == expected
+        assert date.fromordinal(ordinal) == expected
+        reference = date(cancel_year, cancel_month, 1)
+        assert date.fromordinal(next_renewal_ordinal(start, reference, holidays)) == \
+            _baseline_next_renewal(pd.Timestamp(start), pd.Timestamp(reference), holidays).date()